@@ -1,111 +1,1053 @@
+import collections
+import collections.abc
 import importlib
-import concurrent.futures
+import inspect
+import time
+import types
 from functools import partial
 from urllib.parse import urlparse
 
-import requests
+from requests.exceptions import RequestException, Timeout
+from requests.structures import CaseInsensitiveDict
+
+from . import concurrency, deadlines, instrumentation
+from .cache import DiskCache, ResponseCache, get_default_cache, \
+    set_default_cache
+from .concurrency import Deferred
+from .deadlines import deadline
+from .decoders import available_decoders, get_default_decoder, \
+    set_default_decoder
+from .instrumentation import MetricsCollector, Observer, add_observer, \
+    remove_observer
+from .limits import AdaptiveLimiter, RateLimiter, TokenBucket, retry_after
+from .pagination import Paginator, PageStream
+from .registry import ModelRegistry, get_registry, validate_models
+from .session import Session, current_session
+from .streaming import iter_json_array
+from .transport import HedgedTransport, Transport, get_default_transport, \
+    set_default_transport
 
 
 class NotFound(BaseException):
     pass
 
 
-class APIResource(object):
+class DeadlineExceeded(NotFound):
+    pass
+
+
+class Throttled(NotFound):
+    """The server kept answering ``429`` or ``503`` after retries;
+    ``retry_after`` is the delay it last asked for, in seconds, if any."""
+
+    def __init__(self, message, retry_after=None):
+        super(Throttled, self).__init__(message)
+        self.retry_after = retry_after
+
+
+def _getattr_static(obj, name, default=None):
+    """Like ``getattr``, but returns functions stored on a class as they
+    are instead of binding them."""
+    value = inspect.getattr_static(obj, name, default)
+    if isinstance(value, staticmethod):
+        return value.__func__
+    return value
+
+
+def _is_deadline_error(error):
+    return isinstance(error, DeadlineExceeded)
+
+
+class BulkResult(list):
+    """Results of a bulk operation, in request order.
+
+    Items that failed are ``None`` in the list, and their exceptions are
+    kept in ``errors``, keyed by the lookup value (or, for collections, the
+    index) that failed.
+    """
+
+    def __init__(self, items=(), errors=None):
+        super(BulkResult, self).__init__(items)
+        self.errors = errors if errors is not None else {}
+
+
+def _projection(template, fields, url, only=None):
+    if only is not None:
+        names = list(only)
+        unknown = [name for name in names if name not in fields]
+        if unknown:
+            raise ValueError('Field names {0} not found in model'.format(
+                ', '.join(unknown)))
+    elif template is not None:
+        names = list(fields)
+    else:
+        return url, None
+    if template is not None:
+        url = '{0}{1}{2}'.format(url, '&' if urlparse(url).query else '?',
+                                 template.format(fields=','.join(names)))
+    return url, names
+
+
+def _prune(item, names):
+    if not isinstance(item, dict):
+        return item
+    return {name: item[name] for name in names if name in item}
+
+
+def _inherits_attribute(cls, name):
+    return hasattr(cls, name) and \
+        not isinstance(getattr(cls, name), FieldDescriptor)
+
+
+class APIResourceMeta(type):
+    def __new__(mcs, name, bases, namespace):
+        if namespace.get('compact', any(getattr(base, 'compact', False)
+                                        for base in bases)):
+            fields = namespace.get('fields')
+            if fields is None:
+                fields = next(base.fields for base in bases
+                              if hasattr(base, 'fields'))
+            slots = tuple(namespace.get('__slots__', ()))
+            namespace['__slots__'] = slots + tuple(
+                field_name for field_name in fields
+                if field_name not in namespace and
+                not any(_inherits_attribute(base, field_name)
+                        for base in bases))
+        return super().__new__(mcs, name, bases, namespace)
+
+    def __call__(cls, *args, **kwargs):
+        session = current_session()
+        if session is None:
+            return super().__call__(*args, **kwargs)
+        key = cls._identity_key(*args, **kwargs)
+        if key is None:
+            return super().__call__(*args, **kwargs)
+        instance = session.get(key)
+        if instance is None:
+            instance = session.add(key, super().__call__(*args, **kwargs))
+        if not kwargs.get('lazy_load'):
+            # The shared instance may have been created lazily.
+            instance._ensure_loaded()
+        return instance
+
+
+class APIResource(object, metaclass=APIResourceMeta):
+    __slots__ = ('_data', '_lazy_load', '_url', '__weakref__')
     finders = {}
     url = None
+    transport = None
+    cache = None
+    cache_ttl = None
+    stale_ttl = None
+    sparse_fields = None
+    decoder = None
+    executor = None
 
-    def __init__(self, data=None, lazy_load=False, **kwargs):
+    def __init__(self, data=None, lazy_load=False, only=None, **kwargs):
         if lazy_load:
-            self._lazy_load = {'data': data, 'kwargs': kwargs}
+            self._lazy_load = {'data': data, 'kwargs': kwargs, 'only': only}
         else:
             self._lazy_load = False
-            self._parse_inputs(data, kwargs)
+            self._parse_inputs(data, kwargs, only)
+
+    def _parse_inputs(self, data, kwargs, only=None):
+        url = self._input_url(data, kwargs)
+        if url is None:
+            self._url = None
+            self._data = data
+        else:
+            url, names = self._project(url, only)
+            self._url = url
+            self._load_data(url)
+            if names is not None:
+                self._data = self._prune_data(self._data, names)
 
-    def _parse_inputs(self, data, kwargs):
+    def _project(self, url, only=None):
+        return _projection(self._get_setting('sparse_fields'),
+                           getattr(self, 'fields', {}), url, only)
+
+    def _prune_data(self, data, names):
+        return _prune(data, names)
+
+    @classmethod
+    def _input_url(cls, data, kwargs):
         if data is not None:
             if urlparse(str(data)).scheme != '':
-                self._load_data(data)
-            else:
-                self._data = data
-        elif not kwargs and self.url:
-            self._load_data(self.url)
-        elif not self.finders:
+                return data
+            return None
+        elif not kwargs and cls.url:
+            return cls.url
+        return cls.finder_url(**kwargs)
+
+    @classmethod
+    def _identity_key(cls, *args, **kwargs):
+        return None
+
+    @classmethod
+    def finder_url(cls, **kwargs):
+        if not cls.finders:
             raise NotImplementedError
-        else:
-            for key in kwargs:
-                if key in self.finders:
-                    self._load_data(self.finders[key].format(kwargs[key]))
-                    break
-            else:
-                raise ValueError('No finders for provided keys')
+        for key in kwargs:
+            if key in cls.finders:
+                return cls.finders[key].format(kwargs[key])
+        raise ValueError('No finders for provided keys')
+
+    @classmethod
+    def invalidate(cls, url=None, only=None, **kwargs):
+        if url is None:
+            url = cls.finder_url(**kwargs) if kwargs else cls.url
+            # Entries are cached under the URL with its projection applied.
+            model = getattr(cls, 'model', None) or cls
+            template = cls.sparse_fields if cls.sparse_fields is not None \
+                else model.sparse_fields
+            url = _projection(template, getattr(model, 'fields', {}), url,
+                              only)[0]
+        cache = cls.cache if cls.cache is not None else get_default_cache()
+        return cache.invalidate(url)
+
+    def _get_setting(self, name, getter=getattr):
+        return getter(self, name)
+
+    def get_transport(self):
+        return self._get_setting('transport') or get_default_transport()
+
+    def get_cache(self):
+        cache = self._get_setting('cache')
+        return cache if cache is not None else get_default_cache()
+
+    def get_decoder(self):
+        # Plain functions set on the class must not be bound to the model.
+        decoder = self._get_setting('decoder', _getattr_static)
+        if decoder is None:
+            return get_default_decoder()
+        return decoder
+
+    def get_executor(self):
+        executor = self._get_setting('executor')
+        return executor if executor is not None else \
+            concurrency.get_executor()
+
+    def _ensure_loaded(self):
+        if self._lazy_load:
+            self._parse_inputs(**self._lazy_load)
+            self._lazy_load = False
+        return self
 
     def _load_data(self, url):
-        response = requests.get(url)
+        self._data = self._fetch_data(url)
+
+    def _fetch_data(self, url):
+        return self._fetch(url)[0]
+
+    def _fetch(self, url):
+        ttl = self._get_setting('cache_ttl')
+        if ttl is None:
+            return self._coalesced_request(url)
+        entry = self.get_cache().get(url, allow_stale=True)
+        if entry is not None and entry.is_fresh():
+            self._observe_cache(url, 'hit')
+            return self._entry_data(entry), entry.headers
+        if entry is not None and self._is_servable(entry):
+            self._observe_cache(url, 'stale')
+            self.get_executor().refresh(url, self._refresh_entry, url, ttl,
+                                        entry)
+            return self._entry_data(entry), entry.headers
+        self._observe_cache(url, 'miss' if entry is None else 'expired')
+        return self._coalesced_request(url, ttl, entry)
+
+    def _coalesced_request(self, url, ttl=None, entry=None):
+        """Request ``url``, sharing the response with concurrent requests
+        for it.
+
+        A request that had to wait on another gives up when its own deadline
+        passes, and sends its own request instead of failing with the other
+        one's ``DeadlineExceeded``.
+        """
+        try:
+            return concurrency.fetches.do(
+                url, self._request, url, ttl, entry,
+                timeout=deadlines.remaining(), retry=_is_deadline_error)
+        except Timeout:
+            left = deadlines.remaining()
+            if left is None or left > 0:
+                raise
+            raise DeadlineExceeded('Deadline passed waiting for {0}'.format(
+                url))
+
+    def _observe_cache(self, url, result):
+        if instrumentation.observers:
+            instrumentation.notify('cache_lookup', self, url, result)
+
+    def _is_servable(self, entry):
+        stale_ttl = self._get_setting('stale_ttl')
+        return stale_ttl is not None and entry.is_fresh(grace=stale_ttl)
+
+    def _refresh_entry(self, url, ttl, entry):
+        try:
+            concurrency.fetches.do(url, self._request, url, ttl, entry)
+        except (Exception, NotFound):
+            # The stale entry keeps being served until its window closes.
+            pass
+
+    def _request(self, url, ttl=None, entry=None):
+        headers = self._conditional_headers(entry)
+        if instrumentation.observers:
+            response = instrumentation.observe_request(
+                self, url, self._send, url, headers)
+        else:
+            response = self._send(url, headers)
+        return self._handle_response(url, response, ttl, entry)
+
+    def _send(self, url, headers=None, stream=False):
+        left = deadlines.remaining()
+        if left is None:
+            with self.get_executor().host_slot(url):
+                return self.get_transport().get(url, headers=headers,
+                                                stream=stream)
+        if left <= 0:
+            raise DeadlineExceeded('Deadline passed before {0}'.format(url))
+        transport = self.get_transport()
+        try:
+            with self.get_executor().host_slot(url):
+                # The wait for a slot may have used up part of the budget.
+                left = deadlines.remaining()
+                timeout = transport.timeout
+                if not isinstance(timeout, (int, float)) or timeout > left:
+                    timeout = left
+                return transport.get(url, headers=headers, timeout=timeout,
+                                     stream=stream)
+        except Timeout:
+            if deadlines.remaining() > 0:
+                raise
+            raise DeadlineExceeded('Deadline passed waiting for {0}'.format(
+                url))
+
+    def _conditional_headers(self, entry):
+        if entry is None or entry.headers is None:
+            return None
+        cached = CaseInsensitiveDict(entry.headers)
+        headers = {}
+        if cached.get('ETag'):
+            headers['If-None-Match'] = cached['ETag']
+        if cached.get('Last-Modified'):
+            headers['If-Modified-Since'] = cached['Last-Modified']
+        return headers or None
+
+    def _handle_response(self, url, response, ttl=None, entry=None):
+        if entry is not None and response.status_code == 304:
+            headers = CaseInsensitiveDict(entry.headers)
+            headers.update(response.headers)
+            self.get_cache().touch(url, ttl, headers=headers)
+            return self._entry_data(entry), headers
+        self._check_response(response)
+        if entry is not None and entry.matches(response.content):
+            data = self._entry_data(entry)
+        else:
+            data = self._decode(response.content)
+        if ttl is not None:
+            self.get_cache().set(url, data, ttl, headers=response.headers,
+                                 content=response.content)
+        return data, response.headers
+
+    def _entry_data(self, entry):
+        if entry.data is None and entry.content is not None:
+            entry.data = self._decode(entry.content)
+        return entry.data
+
+    def _decode(self, content):
+        start = time.perf_counter() if instrumentation.observers else None
+        try:
+            data = self.get_decoder()(content)
+        except ValueError:
+            raise ValueError('Invalid JSON in response: {0}'.format(content))
+        if start is not None:
+            instrumentation.notify('response_decoded', self, len(content),
+                                   time.perf_counter() - start)
+        return data
+
+    def _check_response(self, response):
+        if response.status_code in (429, 503):
+            raise Throttled(
+                'Received status code {0}'.format(response.status_code),
+                retry_after=retry_after(response.headers))
         if response.status_code != 200:
             raise NotFound(
                 'Received status code {0}'.format(response.status_code))
-        try:
-            self._data = response.json()
-        except ValueError:
-            raise ValueError('Invalid JSON in response: {0}'.format(
-                response.content))
 
 
 class APICollection(APIResource):
     model = None
+    paginator = None
+    stream = False
+    stream_path = None
+    stream_chunk_size = 1 << 16
+    read_ahead = 10
+    _lazy_mode = None
+    _built = None
+    _next_url = None
+    _total = None
+    _stream_url = None
+    _indexes = None
+    _sparse = None
 
     def __init__(self, model=None, *args, **kwargs):
         if model:
             self.model = model
         super(APICollection, self).__init__(*args, **kwargs)
 
+    def _get_setting(self, name, getter=getattr):
+        value = getter(self, name)
+        if value is None and self.model is not None:
+            value = getter(self.model, name, None)
+        return value
+
+    def get_paginator(self):
+        return self._get_setting('paginator')
+
+    def _project(self, url, only=None):
+        fields = self.model.fields if self.model is not None else {}
+        return _projection(self._get_setting('sparse_fields'), fields, url,
+                           only)
+
+    def _prune_data(self, data, names):
+        self._sparse = names
+        if not isinstance(data, list):
+            return data
+        return [_prune(item, names) for item in data]
+
+    def _page_items(self, page):
+        items = self.get_paginator().items(page)
+        if self._sparse is not None:
+            items = [_prune(item, self._sparse) for item in items]
+        return items
+
+    def _load_data(self, url):
+        paginator = self.get_paginator()
+        if paginator is None and self.stream:
+            self._data = []
+            self._stream_url = url
+            return
+        if paginator is None:
+            return super(APICollection, self)._load_data(url)
+        page, headers = self._fetch(url)
+        self._data = list(paginator.items(page))
+        self._next_url = paginator.next_url(page, headers, url)
+        self._total = paginator.total(page)
+
+    def _stream_items(self):
+        url = self._stream_url
+        if instrumentation.observers:
+            response = instrumentation.observe_request(
+                self, url, self._send, url, None, True, stream=True)
+        else:
+            response = self._send(url, stream=True)
+        try:
+            self._check_response(response)
+            items = iter_json_array(
+                response.iter_content(chunk_size=self.stream_chunk_size),
+                path=self.stream_path)
+            if self._sparse is not None:
+                items = (_prune(item, self._sparse) for item in items)
+            yield from items
+        finally:
+            response.close()
+
+    def _load_pages(self):
+        if self._stream_url:
+            self._data = list(self._stream_items())
+            self._stream_url = None
+        if self._next_url:
+            for items in PageStream(self, self._next_url):
+                self._data.extend(items)
+            self._next_url = None
+
+    def _iter_data(self):
+        yield from self._data
+        if self._stream_url:
+            yield from self._stream_items()
+        if self._next_url:
+            for items in PageStream(self, self._next_url):
+                yield from items
+
     def create_model(self, data, lazy_load):
         return self.model(data=data, lazy_load=lazy_load)
 
+    def _build(self, indexes, lazy_load):
+        if self._built is None:
+            self._built = {}
+        cache = self._built
+        missing = [i for i in indexes if i not in cache]
+        if missing:
+            if self._lazy_mode is None:
+                self._lazy_mode = lazy_load
+            create_model = partial(self.create_model,
+                                   lazy_load=self._lazy_mode)
+            if instrumentation.observers:
+                instrumentation.notify('collection_fanout', self,
+                                       len(missing))
+            models = self.get_executor().map(
+                create_model, [self._data[i] for i in missing])
+            cache.update(zip(missing, models))
+        return [cache[i] for i in indexes]
+
     def _load(self, lazy_load):
-        if self._lazy_load:
-            self._parse_inputs(**self._lazy_load)
-            self._lazy_load = False
+        self._ensure_loaded()
         if not hasattr(self, '_models'):
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as e:
-                create_model = partial(self.model, lazy_load=lazy_load)
-                self._models = list(e.map(create_model, self._data))
+            self._load_pages()
+            self._models = self._build(range(len(self._data)), lazy_load)
+            self._built = None
 
     def all(self):
         self._load(lazy_load=False)
         return self._models
 
+    def results(self):
+        """Build every element like ``all()``, but return a ``BulkResult``
+        in which elements that failed to load, for example with
+        ``DeadlineExceeded``, are ``None`` and their errors are keyed by
+        index.
+        """
+        if hasattr(self, '_models'):
+            return BulkResult(self._models)
+        self._ensure_loaded()
+        self._load_pages()
+        built = self._built or {}
+        pending = [i for i in range(len(self._data)) if i not in built]
+        outcomes = dict(zip(pending, self.get_executor().map(
+            self._try_create_model, [self._data[i] for i in pending])))
+        result = BulkResult()
+        for i in range(len(self._data)):
+            model, error = outcomes.get(i, (built.get(i), None))
+            result.append(model)
+            if error is not None:
+                result.errors[i] = error
+        if not result.errors:
+            self._models = list(result)
+            self._built = None
+        return result
+
+    def _try_create_model(self, data):
+        try:
+            return self.create_model(data, lazy_load=False), None
+        except (NotFound, RequestException, ValueError) as e:
+            return None, e
+
     def first(self):
-        self._load(lazy_load=True)
-        if self._models:
-            return self._models[0]
+        if hasattr(self, '_models'):
+            return self._models[0] if self._models else None
+        self._ensure_loaded()
+        if self._stream_url:
+            for data in self._stream_items():
+                return self.create_model(data, lazy_load=True)
+        elif self._data:
+            return self._build([0], lazy_load=True)[0]
 
     def count(self):
         if hasattr(self, '_models'):
             return len(self._models)
-        elif hasattr(self, '_data') and isinstance(self._data, list):
-            return len(self._data)
-        else:
+        self._ensure_loaded()
+        if self._total is not None:
+            return self._total
+        if not isinstance(self._data, list):
             return len(self.all())
+        self._load_pages()
+        return len(self._data)
+
+    def __getitem__(self, index):
+        if hasattr(self, '_models'):
+            return self._models[index]
+        self._ensure_loaded()
+        self._load_pages()
+        if isinstance(index, slice):
+            return self._build(range(*index.indices(len(self._data))),
+                               lazy_load=False)
+        if index < 0:
+            index += len(self._data)
+        if not 0 <= index < len(self._data):
+            raise IndexError('collection index out of range')
+        return self._build([index], lazy_load=False)[0]
+
+    def __iter__(self):
+        """Yield models in order, building them on demand.
+
+        Up to ``read_ahead`` upcoming models are built concurrently while
+        the current one is consumed. Models built by iteration are not kept
+        by the collection, so a full pass holds only a window in memory.
+        """
+        if hasattr(self, '_models'):
+            return iter(self._models)
+        self._ensure_loaded()
+        return self._iter_models()
+
+    def _iter_models(self):
+        executor = self.get_executor()
+        built = self._built or {}
+        pending = collections.deque()
+        data = enumerate(self._iter_data())
+        while True:
+            while len(pending) <= self.read_ahead:
+                try:
+                    index, item = next(data)
+                except StopIteration:
+                    break
+                if index in built:
+                    pending.append(built[index])
+                else:
+                    pending.append(executor.defer(
+                        self.create_model, item, lazy_load=False))
+            if not pending:
+                return
+            model = pending.popleft()
+            yield model.result() if isinstance(model, Deferred) else model
+
+    def values(self, *names):
+        """Return a ``(value, ...)`` tuple of the named fields per element.
+
+        Values are read straight from the collection's data and loaded a
+        column at a time with ``APIField.load_column``, without building
+        models. Relation fields are not supported.
+        """
+        return list(zip(*self._columns(names)))
+
+    def to_columns(self, *names, arrays=None):
+        """Return a dict mapping each named field to a column of values.
+
+        Columns are NumPy arrays when NumPy is installed, or lists
+        otherwise; pass ``arrays=True`` to require NumPy or ``arrays=False``
+        for lists.
+        """
+        columns = self._columns(names)
+        if arrays is not False:
+            try:
+                import numpy
+            except ImportError:
+                if arrays:
+                    raise ImportError('to_columns(arrays=True) requires '
+                                      'NumPy')
+            else:
+                columns = [numpy.asarray(column) for column in columns]
+        return dict(zip(names, columns))
+
+    def _columns(self, names):
+        fields = []
+        for name in names:
+            field = self.model.fields.get(name)
+            if field is None:
+                raise ValueError('Field name {} not found in model'.format(
+                    name))
+            if isinstance(field, APIModelField):
+                raise ValueError('Field {} is a relation; load it through '
+                                 'models instead'.format(name))
+            fields.append(field)
+        self._ensure_loaded()
+        raw = [[] for _ in names]
+        for item in self._iter_data():
+            if not isinstance(item, dict):
+                raise ValueError('Collection elements are references, not '
+                                 'data: {0}'.format(item))
+            for column, name in zip(raw, names):
+                column.append(item.get(name))
+        return [field.load_column(column)
+                for field, column in zip(fields, raw)]
+
+    def filter(self, **conditions):
+        """Return a collection of the elements whose fields equal the given
+        values, such as ``eggs.filter(basket_id='myid')``.
+
+        Conditions are answered from hash indexes over the loaded field
+        values, built on first use and kept for later queries. Models are
+        only built for the elements of the result.
+        """
+        return self._subset(self._match(conditions))
+
+    def get(self, **conditions):
+        """Return the one element matching ``conditions``.
+
+        Raises ``NotFound`` if there is none and ``ValueError`` if there
+        are several.
+        """
+        indexes = self._match(conditions)
+        if not indexes:
+            raise NotFound('No {0} matching {1}'.format(
+                self.model.__name__, conditions))
+        if len(indexes) > 1:
+            raise ValueError('{0} elements match {1}'.format(
+                len(indexes), conditions))
+        return self._model_at(indexes[0])
+
+    def order_by(self, *names):
+        """Return a collection sorted by the named fields; prefix a name
+        with ``-`` for descending order. Missing values sort as the lowest.
+        """
+        indexes = list(range(len(self._rows())))
+        for name in reversed(names):
+            descending = name.startswith('-')
+            column = self._column(name.lstrip('-'))
+            indexes.sort(key=lambda i: (column[i] is not None, column[i]),
+                         reverse=descending)
+        return self._subset(indexes)
+
+    def index_by(self, name):
+        """Return a read-only mapping of the named field's values to
+        elements, which must be unique. Models are built on lookup.
+        """
+        index = self._index(name)
+        for value, indexes in index.items():
+            if len(indexes) > 1:
+                raise ValueError('{0} is not unique: {1} elements have {2!r}'
+                                 .format(name, len(indexes), value))
+        return _ModelIndex(self, index)
+
+    def _model_at(self, index):
+        if hasattr(self, '_models'):
+            return self._models[index]
+        return self._build([index], lazy_load=False)[0]
+
+    def _rows(self):
+        self._ensure_loaded()
+        self._load_pages()
+        return self._data
+
+    def _column(self, name):
+        self._rows()
+        return self._columns([name])[0]
+
+    def _index(self, name):
+        if self._indexes is None:
+            self._indexes = {}
+        index = self._indexes.get(name)
+        if index is None:
+            index = {}
+            for i, value in enumerate(self._column(name)):
+                try:
+                    index.setdefault(value, []).append(i)
+                except TypeError:
+                    raise ValueError(
+                        'Cannot look up elements by {0}: {1!r} is not '
+                        'hashable'.format(name, value))
+            self._indexes[name] = index
+        return index
+
+    def _match(self, conditions):
+        matches = None
+        for name, value in conditions.items():
+            found = self._index(name).get(value, ())
+            matches = set(found) if matches is None else \
+                matches.intersection(found)
+        if matches is None:
+            return list(range(len(self._rows())))
+        return sorted(matches)
+
+    def _subset(self, indexes):
+        rows = self._rows()
+        subset = type(self)(model=self.model,
+                            data=[rows[i] for i in indexes])
+        # Settings given to this instance rather than its class.
+        for name in ('transport', 'cache', 'cache_ttl', 'decoder',
+                     'executor', 'read_ahead'):
+            if name in self.__dict__:
+                setattr(subset, name, self.__dict__[name])
+        return subset
+
+    def prefetch(self, *lookups):
+        """Eagerly load related models for every element of the collection.
+
+        Each lookup names a chain of fields separated by ``__``, such as
+        ``'eggs__basket_id'``. At every depth the distinct URLs of all
+        elements are fetched in one concurrent wave and assigned to the
+        elements, so iterating the collection afterwards makes no requests.
+        """
+        models = self.all()
+        executor = self.get_executor()
+        executor.map(APIResource._ensure_loaded, models)
+        instances = {}
+        for lookup in lookups:
+            level = models
+            for name in lookup.split('__'):
+                level = _prefetch_field(level, name, executor, instances)
+        return self
+
+
+class _ModelIndex(collections.abc.Mapping):
+    def __init__(self, collection, index):
+        self._collection = collection
+        self._index = index
+
+    def __getitem__(self, value):
+        return self._collection._model_at(self._index[value][0])
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+
+class FieldDescriptor(object):
+    """Loads a model field on first access and caches it on the instance.
+
+    This is a non-data descriptor, so once the loaded value is stored in the
+    instance ``__dict__`` later reads are plain attribute lookups.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance._load_field(self.name)
 
 
 class APIModel(APIResource):
+    """A read-only model whose ``fields`` are loaded lazily from its data.
+
+    Fields are compiled into descriptors when the class is created. Set
+    ``compact = True`` to store them in ``__slots__`` instead of a per-instance
+    ``__dict__``, which makes large numbers of small models much lighter;
+    compact models can't be given attributes that aren't fields.
+    """
+
+    __slots__ = ()
     fields = {}
+    compact = False
+    batch_finders = {}
+    batch_size = 100
 
-    def __getattr__(self, field_name):
-        if self._lazy_load:
-            self._parse_inputs(**self._lazy_load)
-            self._lazy_load = False
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        slots = set()
+        for klass in cls.__mro__:
+            slots.update(klass.__dict__.get('__slots__', ()))
+        for field_name, field in cls.fields.items():
+            contribute_to_class = getattr(field, 'contribute_to_class', None)
+            if contribute_to_class is not None:
+                contribute_to_class(cls, field_name)
+            if field_name in slots:
+                continue
+            if not _inherits_attribute(cls, field_name):
+                setattr(cls, field_name, FieldDescriptor(field_name))
+        get_registry().register(cls)
+
+    @classmethod
+    def _identity_key(cls, data=None, lazy_load=False, only=None, **kwargs):
+        try:
+            url = cls._input_url(data, kwargs)
+            if url is not None:
+                url = _projection(cls.sparse_fields, cls.fields, url, only)[0]
+        except (NotImplementedError, ValueError):
+            return None
+        if url is not None:
+            return (cls, url)
+
+    @classmethod
+    def get_many(cls, only=None, **kwargs):
+        """Look up many models by one finder key, for example
+        ``Egg.get_many(egg_id=['organic', 'regular'])``.
 
-        if field_name in self.fields:
-            field = self.fields[field_name]
-            data = self._data.get(field_name)
-            result = field.load(data, self)
-            setattr(self, field_name, result)
-            return result
+        If ``batch_finders`` has a URL for the key, keys are joined with
+        commas into requests of up to ``batch_size`` keys each; otherwise
+        every key is looked up through ``finders``. Requests run
+        concurrently on the shared executor. Returns a ``BulkResult``.
+        ``only`` restricts the loaded fields as it does for a single model.
+        """
+        if len(kwargs) != 1:
+            raise ValueError('get_many takes exactly one finder key')
+        (key, values), = kwargs.items()
+        values = list(values)
+        unique = list(dict.fromkeys(values))
+        executor = cls.executor if cls.executor is not None else \
+            concurrency.get_executor()
+        if key in cls.batch_finders:
+            found = cls._get_batches(key, unique, executor, only)
         else:
+            found = dict(zip(unique, executor.map(
+                partial(cls._get_one, key, only=only), unique)))
+        result = BulkResult()
+        for value in values:
+            model, error = found[value]
+            result.append(model)
+            if error is not None:
+                result.errors[value] = error
+        return result
+
+    @classmethod
+    def _get_one(cls, key, value, only=None):
+        try:
+            return cls(only=only, **{key: value}), None
+        except (NotFound, RequestException, ValueError) as e:
+            return None, e
+
+    @classmethod
+    def _get_batches(cls, key, values, executor, only=None):
+        size = cls.batch_size
+        chunks = [values[i:i + size] for i in range(0, len(values), size)]
+        found = {}
+        batches = executor.map(partial(cls._get_batch, key, only=only),
+                               chunks)
+        for chunk, (items, error) in zip(chunks, batches):
+            # Anything but embedded objects (say, URLs) can't be matched to
+            # a key, so those keys are reported as missing.
+            by_key = {str(item.get(key)): item for item in items
+                      if isinstance(item, dict)}
+            for value in chunk:
+                item = by_key.get(str(value))
+                if item is not None:
+                    found[value] = (cls(data=item), None)
+                else:
+                    found[value] = (None, error or NotFound(
+                        'No {0} {1!r} in batch response'.format(key, value)))
+        return found
+
+    @classmethod
+    def _get_batch(cls, key, values, only=None):
+        url = cls.batch_finders[key].format(','.join(map(str, values)))
+        if only is not None and key not in only:
+            only = [key] + list(only)
+        collection = APICollection(model=cls, data=url, lazy_load=True,
+                                   only=only)
+        try:
+            collection._ensure_loaded()
+            collection._load_pages()
+        except (NotFound, RequestException, ValueError) as e:
+            return [], e
+        return collection._data, None
+
+    def __getattr__(self, field_name):
+        if field_name not in self.fields:
             raise AttributeError(
                 'Field name {} not found in model'.format(field_name))
+        return self._load_field(field_name)
+
+    def _load_field(self, field_name):
+        if instrumentation.observers:
+            return instrumentation.observe_field(
+                self, field_name, self._load_field_value, field_name)
+        return self._load_field_value(field_name)
+
+    def _load_field_value(self, field_name):
+        self._ensure_loaded()
+        field = self.fields[field_name]
+        data = self._data.get(field_name)
+        result = field.load(data, self)
+        setattr(self, field_name, result)
+        return result
+
+    def _loaded_field(self, field_name):
+        try:
+            return True, self.__dict__[field_name]
+        except (AttributeError, KeyError):
+            pass
+        slot = getattr(type(self), field_name, None)
+        if isinstance(slot, types.MemberDescriptorType):
+            try:
+                return True, slot.__get__(self, type(self))
+            except AttributeError:
+                pass
+        return False, None
+
+    def refresh(self):
+        """Reload this model's data from its URL, revalidating any cached
+        copy, and return the names of the fields whose raw data changed.
+
+        Loaded values of unchanged fields are kept; changed fields are
+        reloaded on their next access.
+        """
+        self._ensure_loaded()
+        if self._url is None:
+            raise ValueError('Model was not loaded from a URL')
+        ttl = self._get_setting('cache_ttl')
+        entry = None
+        if ttl is not None:
+            entry = self.get_cache().get(self._url, count=False,
+                                         allow_stale=True)
+        data = self._coalesced_request(self._url, ttl, entry)[0]
+        return self._replace_data(data)
+
+    def _replace_data(self, data):
+        names = self._project(self._url)[1]
+        if names is not None:
+            data = self._prune_data(data, names)
+        old, self._data = self._data or {}, data
+        changed = [name for name in self.fields
+                   if old.get(name) != data.get(name)]
+        for name in changed:
+            try:
+                delattr(self, name)
+            except AttributeError:
+                pass
+        return changed
+
+
+def _prefetch_field(models, name, executor, instances):
+    related = {}
+    assignments = []
+    for model in models:
+        field = model.fields.get(name)
+        if field is None:
+            raise ValueError('Field name {} not found in model'.format(name))
+        if not isinstance(field, APIModelField):
+            getattr(model, name)
+            continue
+        loaded, value = model._loaded_field(name)
+        if loaded:
+            assignments.append((None, name, value))
+            continue
+        field_model = field.get_model(model)
+        if isinstance(field, APICollectionField):
+            data = field.url.format(model) if field.url else \
+                model._data.get(name)
+            value = APICollection(model=field_model, data=data,
+                                  lazy_load=True)
+        else:
+            data = model._data.get(name)
+            if data is None:
+                value = None
+            else:
+                value = field_model(data=data, lazy_load=True)
+        if isinstance(data, str):
+            key = (field_model, data)
+            if isinstance(value, APICollection):
+                key = (APICollection,) + key
+            value = related[key] = instances.setdefault(key, value)
+        assignments.append((model, name, value))
+    executor.map(APIResource._ensure_loaded, list(related.values()))
+
+    elements = {}
+    collections = []
+    seen = set()
+    for model, name, value in assignments:
+        if model is not None:
+            setattr(model, name, value)
+        if isinstance(value, APICollection):
+            if id(value) in seen:
+                continue
+            seen.add(id(value))
+            if hasattr(value, '_models'):
+                elements.update((id(m), m) for m in value._models)
+                continue
+            value._ensure_loaded()
+            value._load_pages()
+            items = []
+            for data in value._data:
+                if isinstance(data, str):
+                    key = (value.model, data)
+                    if key not in instances:
+                        instances[key] = value.model(data=data,
+                                                     lazy_load=True)
+                    item = instances[key]
+                else:
+                    item = value.model(data=data)
+                elements[id(item)] = item
+                items.append(item)
+            collections.append((value, items))
+        elif value is not None:
+            elements[id(value)] = value
+    executor.map(APIResource._ensure_loaded, list(elements.values()))
+    for collection, items in collections:
+        if not hasattr(collection, '_models'):
+            collection._models = items
+    return list(elements.values())
 
 
 class APIField(object):
@@ -116,16 +1058,39 @@ class APIField(object):
         if data is not None:
             return self.wrapper_func(data)
 
+    def load_column(self, values):
+        wrapper_func = self.wrapper_func
+        return [None if value is None else wrapper_func(value)
+                for value in values]
+
 
 class APIModelField(APIField):
     _type = APIModel
 
     def __init__(self, model):
         super().__init__(wrapper_func=model)
+        self.owner = None
+        self.name = None
+
+    def contribute_to_class(self, cls, name):
+        if self.owner is None:
+            self.owner = cls
+            self.name = name
+            get_registry().defer(self)
+
+    def get_model(self, parent=None):
+        model = self.wrapper_func
+        if isinstance(model, str):
+            module = parent.__module__ if parent is not None else None
+            model = get_registry().resolve(self, module)
+            if model is None:
+                model = self._string_to_class(self.wrapper_func, parent)
+                get_registry().bind(self, model)
+        return model
 
     def load(self, data, parent=None):
-        self.wrapper_func = self._string_to_class(self.wrapper_func, parent)
-        return super().load(data=data, parent=parent)
+        if data is not None:
+            return self.get_model(parent)(data)
 
     def _string_to_class(self, type_, parent):
         if isinstance(type_, str):
@@ -144,7 +1109,6 @@ class APICollectionField(APIModelField):
         super().__init__(model=model)
 
     def load(self, data, parent=None):
-        self.wrapper_func = self._string_to_class(self.wrapper_func, parent)
         if self.url:
             data = self.url.format(parent)
-        return APICollection(model=self.wrapper_func, data=data)
+        return APICollection(model=self.get_model(parent), data=data)
@@ -0,0 +1,385 @@
+import asyncio
+import contextvars
+import json
+
+from . import APICollection, APIModel, APIModelField, DeadlineExceeded, \
+    deadlines, instrumentation
+from .limits import retry_after
+from .pagination import _lookup
+from .transport import RETRY_STATUSES
+
+
+class AsyncResponse(object):
+    __slots__ = ('status_code', 'headers', 'content')
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncTransport(object):
+    """Pooled asyncio HTTP transport built on aiohttp.
+
+    ``limit`` caps open connections overall and ``limit_per_host`` caps them
+    per host, which also bounds how many requests are in flight at once.
+    A client session is created per event loop on first use. ``compress``,
+    ``rate_limiter``, ``retries`` and ``max_retry_wait`` work as they do for
+    ``Transport``.
+    """
+
+    def __init__(self, limit=100, limit_per_host=0, timeout=None,
+                 headers=None, compress=True, rate_limiter=None, retries=2,
+                 max_retry_wait=30):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.compress = compress
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.max_retry_wait = max_retry_wait
+        self.headers = {
+            'Accept-Encoding': 'gzip, deflate' if compress else 'identity'}
+        self.headers.update(headers or {})
+        self._sessions = {}
+
+    def create_session(self):
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError('AsyncTransport requires aiohttp; install it '
+                              'with "pip install apimodel[async]"')
+        connector = aiohttp.TCPConnector(limit=self.limit,
+                                         limit_per_host=self.limit_per_host)
+        return aiohttp.ClientSession(
+            connector=connector, headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    @property
+    def session(self):
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = self._sessions[loop] = self.create_session()
+        return session
+
+    async def get(self, url, headers=None):
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                wait = self.rate_limiter.reserve(url)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            response = await self._send(url, headers)
+            if response.status_code not in RETRY_STATUSES or \
+                    attempt >= self.retries:
+                return response
+            wait = retry_after(response.headers)
+            if wait is None:
+                wait = 0.5 * 2 ** attempt
+            left = deadlines.remaining()
+            if wait > self.max_retry_wait or (left is not None and
+                                              wait >= left):
+                return response
+            if self.rate_limiter is not None:
+                self.rate_limiter.pause(url, wait)
+            else:
+                await asyncio.sleep(wait)
+            attempt += 1
+
+    async def _send(self, url, headers=None):
+        async with self.session.get(url, headers=headers) as response:
+            content = await response.read()
+            return AsyncResponse(response.status, response.headers, content)
+
+    async def close(self):
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+_default_transport = AsyncTransport()
+
+
+def get_default_transport():
+    return _default_transport
+
+
+def set_default_transport(transport):
+    global _default_transport
+    _default_transport = transport
+
+
+class AsyncAPIResource(object):
+    """Mixin giving an ``APIResource`` awaitable loading.
+
+    Constructing an async resource never performs I/O; its data is fetched
+    on the first ``await resource.fetch()`` (or an awaited field access).
+    """
+
+    __slots__ = ()
+
+    async_transport = None
+
+    def __init__(self, data=None, lazy_load=True, only=None, **kwargs):
+        self._lazy_load = {'data': data, 'kwargs': kwargs, 'only': only}
+
+    @classmethod
+    async def get(cls, data=None, **kwargs):
+        return await cls(data, **kwargs).fetch()
+
+    def get_async_transport(self):
+        transport = self._get_setting('async_transport')
+        return transport if transport is not None else \
+            get_default_transport()
+
+    async def fetch(self):
+        if self._lazy_load:
+            url = self._input_url(self._lazy_load['data'],
+                                  self._lazy_load['kwargs'])
+            if url is None:
+                self._url = None
+                self._data = self._lazy_load['data']
+            else:
+                url, names = self._project(url, self._lazy_load['only'])
+                self._url = url
+                self._data = await self._afetch_data(url)
+                if names is not None:
+                    self._data = self._prune_data(self._data, names)
+            self._lazy_load = False
+        return self
+
+    async def _afetch_data(self, url):
+        return (await self._afetch(url))[0]
+
+    async def _afetch(self, url):
+        ttl = self._get_setting('cache_ttl')
+        entry = None
+        if ttl is not None:
+            entry = self.get_cache().get(url, allow_stale=True)
+            if entry is not None and entry.is_fresh():
+                self._observe_cache(url, 'hit')
+                return self._entry_data(entry), entry.headers
+            if entry is not None and self._is_servable(entry):
+                self._observe_cache(url, 'stale')
+                _inflight.start(url, self._arequest, url, ttl, entry,
+                                limit=self.get_executor().max_refreshes)
+                return self._entry_data(entry), entry.headers
+            self._observe_cache(url, 'miss' if entry is None else 'expired')
+        return await _inflight.do(url, self._arequest, url, ttl, entry)
+
+    async def _arequest(self, url, ttl=None, entry=None):
+        headers = self._conditional_headers(entry)
+        if instrumentation.observers:
+            response = await instrumentation.aobserve_request(
+                self, url, self._asend, url, headers)
+        else:
+            response = await self._asend(url, headers)
+        return self._handle_response(url, response, ttl, entry)
+
+    async def _asend(self, url, headers=None):
+        request = self.get_async_transport().get(url, headers)
+        left = deadlines.remaining()
+        if left is None:
+            return await request
+        if left <= 0:
+            request.close()
+            raise DeadlineExceeded('Deadline passed before {0}'.format(url))
+        try:
+            return await asyncio.wait_for(request, left)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded('Deadline passed waiting for {0}'.format(
+                url))
+
+
+class _AsyncSingleFlight(object):
+    def __init__(self):
+        self._calls = {}
+        self._refreshes = set()
+
+    async def do(self, key, func, *args):
+        loop_key = (asyncio.get_running_loop(), key)
+        future = self._calls.get(loop_key)
+        if future is None:
+            future = self._calls[loop_key] = asyncio.ensure_future(
+                func(*args))
+            future.add_done_callback(
+                lambda f: self._calls.pop(loop_key, None))
+            return await asyncio.shield(future)
+        # Waiting on another task's request is bounded by our own deadline,
+        # and its running out of its deadline doesn't fail us.
+        done, _ = await asyncio.wait({future},
+                                     timeout=deadlines.remaining())
+        if not done:
+            raise DeadlineExceeded('Deadline passed waiting for {0}'.format(
+                key))
+        try:
+            return future.result()
+        except DeadlineExceeded:
+            return await func(*args)
+
+    def start(self, key, func, *args, limit=None):
+        loop = asyncio.get_running_loop()
+        if (loop, key) in self._calls or (
+                limit is not None and len(self._refreshes) >= limit):
+            return False
+        # The task starts from a fresh context, so the refresh isn't cut
+        # short by the deadline of the load that triggered it.
+        future = self._calls[(loop, key)] = contextvars.Context().run(
+            asyncio.ensure_future, func(*args))
+        future.add_done_callback(lambda f: self._calls.pop((loop, key), None))
+        self._refreshes.add((loop, key))
+        future.add_done_callback(
+            lambda f: self._refreshes.discard((loop, key)))
+        # Failed background refreshes leave the stale entry in place.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return True
+
+
+_inflight = _AsyncSingleFlight()
+
+
+class AsyncAPIModel(AsyncAPIResource, APIModel):
+    """Asyncio counterpart of ``APIModel``.
+
+    Fields are read with ``await model.aget(name)``. Once loaded, a field is
+    also available as a plain attribute.
+    """
+
+    async def aget(self, field_name):
+        loaded, value = self._loaded_field(field_name)
+        if loaded:
+            return value
+        if field_name not in self.fields:
+            raise AttributeError(
+                'Field name {} not found in model'.format(field_name))
+        await self.fetch()
+        field = self.fields[field_name]
+        data = self._data.get(field_name)
+        aload = getattr(field, 'aload', None)
+        if aload is not None:
+            result = await aload(data, self)
+        else:
+            result = field.load(data, self)
+        setattr(self, field_name, result)
+        return result
+
+    async def arefresh(self):
+        """Awaitable counterpart of ``APIModel.refresh()``."""
+        await self.fetch()
+        if self._url is None:
+            raise ValueError('Model was not loaded from a URL')
+        ttl = self._get_setting('cache_ttl')
+        entry = None
+        if ttl is not None:
+            entry = self.get_cache().get(self._url, count=False,
+                                         allow_stale=True)
+        data = (await _inflight.do(self._url, self._arequest, self._url, ttl,
+                                   entry))[0]
+        return self._replace_data(data)
+
+    def _load_field(self, field_name):
+        raise AttributeError(
+            'Field {0} is not loaded yet; use "await model.aget({0!r})"'
+            .format(field_name))
+
+
+class AsyncAPICollection(AsyncAPIResource, APICollection):
+    """Asyncio counterpart of ``APICollection``.
+
+    ``await collection.all()`` loads every element concurrently, at most
+    ``concurrency`` at a time; ``async for`` yields elements in order while
+    reading ahead by the same amount. With a ``paginator``, every page is
+    read when the collection is fetched. Responses of ``stream``
+    collections are read whole, with ``stream_path`` still applied.
+    """
+
+    concurrency = 10
+
+    def __init__(self, model=None, data=None, **kwargs):
+        if model:
+            self.model = model
+        super(AsyncAPICollection, self).__init__(data, **kwargs)
+
+    async def _afetch_data(self, url):
+        paginator = self.get_paginator()
+        if paginator is None:
+            data = await super(AsyncAPICollection, self)._afetch_data(url)
+            if self.stream and self.stream_path:
+                data = _lookup(data, self.stream_path)
+                if data is None:
+                    raise ValueError('No "{0}" key in response'.format(
+                        self.stream_path))
+            return data
+        data = []
+        while url:
+            page, headers = await self._afetch(url)
+            data.extend(paginator.items(page))
+            url = paginator.next_url(page, headers, url)
+        return data
+
+    async def _create_model(self, data):
+        return await self.model(data).fetch()
+
+    async def all(self):
+        if not hasattr(self, '_models'):
+            await self.fetch()
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def create(data):
+                async with semaphore:
+                    return await self._create_model(data)
+
+            self._models = list(await asyncio.gather(
+                *[create(data) for data in self._data]))
+        return self._models
+
+    async def first(self):
+        if hasattr(self, '_models'):
+            return self._models[0] if self._models else None
+        await self.fetch()
+        if self._data:
+            return await self._create_model(self._data[0])
+
+    async def count(self):
+        if hasattr(self, '_models'):
+            return len(self._models)
+        await self.fetch()
+        return len(self._data)
+
+    async def __aiter__(self):
+        if hasattr(self, '_models'):
+            for model in self._models:
+                yield model
+            return
+        await self.fetch()
+        pending = []
+        for data in self._data:
+            pending.append(asyncio.ensure_future(self._create_model(data)))
+            if len(pending) >= self.concurrency:
+                yield await pending.pop(0)
+        while pending:
+            yield await pending.pop(0)
+
+
+class AsyncAPIModelField(APIModelField):
+    async def aload(self, data, parent=None):
+        model = self.get_model(parent)
+        if data is not None:
+            return await model(data).fetch()
+
+
+class AsyncAPICollectionField(AsyncAPIModelField):
+    def __init__(self, model, url=None):
+        self.url = url
+        super().__init__(model=model)
+
+    async def aload(self, data, parent=None):
+        model = self.get_model(parent)
+        if self.url:
+            data = self.url.format(parent)
+        return AsyncAPICollection(model=model, data=data)
+
@@ -0,0 +1,316 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from requests.structures import CaseInsensitiveDict
+
+
+def _digest(content):
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+class CacheEntry(object):
+    __slots__ = ('data', 'expires', 'headers', 'content', 'digest')
+
+    def __init__(self, data, expires, headers=None, content=None,
+                 digest=None):
+        self.data = data
+        self.expires = expires
+        self.headers = headers
+        self.content = content
+        self.digest = digest
+
+    def is_fresh(self, now=None, grace=0):
+        return self.expires is None or \
+            (now or time.monotonic()) < self.expires + grace
+
+    def matches(self, content):
+        """Return whether ``content`` is the body this entry was stored
+        from, when that is known."""
+        if self.content is not None:
+            return self.content == content
+        return self.digest is not None and self.digest == _digest(content)
+
+
+class ResponseCache(object):
+    """Thread-safe in-memory cache of decoded responses keyed by URL.
+
+    Entries expire after their TTL and the least recently used entry is
+    evicted once ``maxsize`` entries are stored. Expired entries are kept
+    until evicted so that ``get(key, allow_stale=True)`` can return them for
+    revalidation. A digest of each raw body is kept alongside the decoded
+    data, so an identical body fetched again isn't decoded.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, count=True, allow_stale=False):
+        with self._lock:
+            entry = self._entries.get(key)
+            fresh = entry is not None and entry.is_fresh()
+            if entry is not None and not fresh and not allow_stale:
+                del self._entries[key]
+                entry = None
+            if count:
+                if fresh:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def touch(self, key, ttl=None, headers=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            entry.expires = None if ttl is None else time.monotonic() + ttl
+            if headers is not None:
+                entry.headers = headers
+            self._entries.move_to_end(key)
+            self.revalidations += 1
+            return True
+
+    def set(self, key, data, ttl=None, headers=None, content=None):
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = CacheEntry(
+                data, expires, headers,
+                digest=None if content is None else _digest(content))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.revalidations = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'revalidations': self.revalidations,
+                'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+_default_cache = ResponseCache()
+
+
+def get_default_cache():
+    return _default_cache
+
+
+def set_default_cache(cache):
+    global _default_cache
+    _default_cache = cache
+
+
+class DiskCache(object):
+    """Response cache in a SQLite file that several processes can share.
+
+    Raw response bodies are stored (zlib-compressed unless ``compress`` is
+    false) and decoded again on a hit. Entries expire by wall-clock time so
+    every process agrees on freshness. Once ``maxsize`` entries or
+    ``max_bytes`` of stored bodies are exceeded, the least recently used
+    entries are evicted.
+
+    A hit only records its access time when the stored one is more than
+    ``touch_interval`` seconds old, so hot entries don't turn every read
+    into a write. Entry count and size are kept up to date by triggers.
+    """
+
+    def __init__(self, path, maxsize=10000, max_bytes=None, compress=True,
+                 timeout=30, touch_interval=1):
+        self.path = path
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.timeout = timeout
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._local = threading.local()
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, content BLOB, headers TEXT, '
+                'compressed INTEGER, size INTEGER, expires REAL, '
+                'accessed REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed '
+                               'ON entries (accessed)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS totals ('
+                'id INTEGER PRIMARY KEY CHECK (id = 0), count INTEGER, '
+                'size INTEGER)')
+            connection.execute(
+                'INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), '
+                'COALESCE(SUM(size), 0) FROM entries')
+            connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT '
+                'ON entries BEGIN UPDATE totals SET count = count + 1, '
+                'size = size + new.size; END')
+            connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF '
+                'size ON entries BEGIN UPDATE totals SET '
+                'size = size + new.size - old.size; END')
+            connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE '
+                'ON entries BEGIN UPDATE totals SET count = count - 1, '
+                'size = size - old.size; END')
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def __len__(self):
+        return self._totals(self._connect())[0]
+
+    def _totals(self, connection):
+        return connection.execute(
+            'SELECT count, size FROM totals').fetchone()
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, count=True, allow_stale=False):
+        connection = self._connect()
+        row = connection.execute(
+            'SELECT content, headers, compressed, expires, accessed '
+            'FROM entries WHERE key = ?', (key,)).fetchone()
+        now = time.time()
+        fresh = row is not None and (row[3] is None or now < row[3])
+        if row is not None and not fresh and not allow_stale:
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            row = None
+        if count:
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if row is None:
+            return None
+        content, headers, compressed, expires, accessed = row
+        if now - accessed > self.touch_interval:
+            connection.execute(
+                'UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+        if compressed:
+            content = zlib.decompress(content)
+        if expires is not None:
+            expires = time.monotonic() + (expires - now)
+        return CacheEntry(None, expires,
+                          CaseInsensitiveDict(json.loads(headers)), content)
+
+    def touch(self, key, ttl=None, headers=None):
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        if headers is None:
+            cursor = self._connect().execute(
+                'UPDATE entries SET expires = ?, accessed = ? WHERE key = ?',
+                (expires, now, key))
+        else:
+            cursor = self._connect().execute(
+                'UPDATE entries SET expires = ?, accessed = ?, headers = ? '
+                'WHERE key = ?',
+                (expires, now, json.dumps(dict(headers)), key))
+        if cursor.rowcount > 0:
+            self.revalidations += 1
+            return True
+        return False
+
+    def set(self, key, data, ttl=None, headers=None, content=None):
+        if content is None:
+            content = json.dumps(data).encode('utf-8')
+        compressed = self.compress
+        if compressed:
+            content = zlib.compress(content)
+        now = time.time()
+        connection = self._connect()
+        # An upsert rather than INSERT OR REPLACE, whose implicit delete
+        # wouldn't fire the totals trigger.
+        connection.execute(
+            'INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET content = excluded.content, '
+            'headers = excluded.headers, compressed = excluded.compressed, '
+            'size = excluded.size, expires = excluded.expires, '
+            'accessed = excluded.accessed',
+            (key, content, json.dumps(dict(headers or {})), int(compressed),
+             len(content), None if ttl is None else now + ttl, now))
+        self._evict(connection)
+
+    def _evict(self, connection):
+        count, size = self._totals(connection)
+        if count > self.maxsize:
+            connection.execute(
+                'DELETE FROM entries WHERE key IN (SELECT key FROM entries '
+                'ORDER BY accessed LIMIT ?)', (count - self.maxsize,))
+        if self.max_bytes is not None and size > self.max_bytes:
+            excess = size - self.max_bytes
+            keys = []
+            for key, entry_size in connection.execute(
+                    'SELECT key, size FROM entries ORDER BY accessed'):
+                keys.append((key,))
+                excess -= entry_size
+                if excess <= 0:
+                    break
+            connection.executemany('DELETE FROM entries WHERE key = ?', keys)
+
+    def invalidate(self, key):
+        cursor = self._connect().execute(
+            'DELETE FROM entries WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def clear(self):
+        self._connect().execute('DELETE FROM entries')
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def stats(self):
+        count, size = self._totals(self._connect())
+        return {'hits': self.hits, 'misses': self.misses,
+                'revalidations': self.revalidations, 'size': count,
+                'maxsize': self.maxsize, 'bytes': size,
+                'max_bytes': self.max_bytes}
@@ -0,0 +1,279 @@
+import concurrent.futures
+import contextlib
+import contextvars
+import threading
+from urllib.parse import urlparse
+
+from requests.exceptions import Timeout
+
+from . import deadlines
+
+
+class _Call(object):
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Collapses concurrent calls that share a key into a single call.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for it and receive the same result or exception.
+    Waiting callers give up with ``requests.Timeout`` after ``timeout``
+    seconds, and call the function themselves instead of raising an
+    exception for which ``retry(exception)`` is true.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, timeout=None, retry=None, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if not call.event.wait(timeout):
+                raise Timeout('Gave up waiting for {0}'.format(key))
+            if call.error is not None:
+                if retry is not None and retry(call.error):
+                    return func(*args, **kwargs)
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+fetches = SingleFlight()
+
+
+class _Batch(object):
+    def __init__(self, func, items):
+        self.func = func
+        self.items = items
+        self.results = [None] * len(items)
+        self.error = None
+        self._next = 0
+        self._pending = len(items)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not items:
+            self._done.set()
+
+    def _take(self):
+        with self._lock:
+            if self._next >= len(self.items) or self.error is not None:
+                return None
+            index = self._next
+            self._next += 1
+            return index
+
+    def _finish(self, count=1):
+        with self._lock:
+            self._pending -= count
+            if self._pending <= 0:
+                self._done.set()
+
+    def work(self):
+        while True:
+            index = self._take()
+            if index is None:
+                return
+            try:
+                self.results[index] = self.func(self.items[index])
+            except BaseException as e:
+                with self._lock:
+                    if self.error is None:
+                        self.error = e
+                    skipped = len(self.items) - self._next
+                    self._next = len(self.items)
+                self._finish(1 + skipped)
+            else:
+                self._finish()
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.results
+
+
+class Deferred(object):
+    """A task queued on the shared pool that the waiter may run itself.
+
+    If no worker has started the task by the time ``result()`` is called,
+    the calling thread runs it, so waiting on a deferred never blocks on a
+    saturated pool.
+    """
+
+    def __init__(self, func, args, kwargs):
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._context = contextvars.copy_context()
+        self._started = False
+        self._result = None
+        self._error = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def run(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        try:
+            self._result = self._context.run(self._func, *self._args,
+                                             **self._kwargs)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def result(self):
+        self.run()
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class SharedExecutor(object):
+    """Library-wide, bounded thread pool used for collection fan-out.
+
+    ``max_workers`` caps the helper threads across all collections, and
+    ``max_per_host`` caps concurrent requests against any one host. The
+    calling thread always works through its own batch as well, so nested
+    loads started from inside a worker make progress even when every
+    helper thread is busy. At most ``max_refreshes`` background cache
+    refreshes run at once.
+    """
+
+    def __init__(self, max_workers=16, max_per_host=None, max_refreshes=4):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.max_refreshes = max_refreshes
+        self._pool = None
+        self._hosts = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix='apimodel')
+        return self._pool
+
+    def map(self, func, iterable):
+        batch = _Batch(func, list(iterable))
+        for _ in range(min(len(batch.items) - 1, self.max_workers)):
+            self.pool.submit(contextvars.copy_context().run, batch.work)
+        batch.work()
+        return batch.wait()
+
+    def submit(self, func, *args, **kwargs):
+        return self.pool.submit(contextvars.copy_context().run,
+                                func, *args, **kwargs)
+
+    def defer(self, func, *args, **kwargs):
+        deferred = Deferred(func, args, kwargs)
+        self.pool.submit(deferred.run)
+        return deferred
+
+    def refresh(self, key, func, *args, **kwargs):
+        """Run ``func`` in the background unless ``key`` is already being
+        refreshed or every refresh slot is taken.
+
+        Returns the future, or ``None`` if the refresh was skipped.
+        """
+        with self._lock:
+            if key in self._refreshing or \
+                    len(self._refreshing) >= self.max_refreshes:
+                return None
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        try:
+            # A fresh context, so the refresh isn't cut short by the
+            # deadline of the load that triggered it.
+            return self.pool.submit(contextvars.Context().run, run)
+        except BaseException:
+            with self._lock:
+                self._refreshing.discard(key)
+            raise
+
+    @contextlib.contextmanager
+    def host_slot(self, url):
+        if not self.max_per_host:
+            yield
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            slot = self._hosts.get(host)
+            if slot is None:
+                slot = self._hosts[host] = threading.BoundedSemaphore(
+                    self.max_per_host)
+        left = deadlines.remaining()
+        if not slot.acquire(timeout=None if left is None else max(left, 0)):
+            raise Timeout('Deadline passed waiting for a slot for {0}'.format(
+                host))
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+
+_default_executor = SharedExecutor()
+
+
+def get_executor():
+    return _default_executor
+
+
+def set_executor(executor):
+    global _default_executor
+    _default_executor = executor
+
+
+def configure(max_workers=None, max_per_host=None, max_refreshes=None):
+    old = get_executor()
+    set_executor(SharedExecutor(
+        max_workers=max_workers or old.max_workers,
+        max_per_host=max_per_host if max_per_host is not None
+        else old.max_per_host,
+        max_refreshes=max_refreshes or old.max_refreshes))
+    old.shutdown(wait=False)
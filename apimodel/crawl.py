@@ -0,0 +1,178 @@
+import collections
+import concurrent.futures
+import os
+
+from requests.exceptions import RequestException
+
+from . import APICollection, APICollectionField, APIModelField, NotFound, \
+    concurrency
+from .transport import get_default_transport
+
+#: A crawled model: its class, the URL it was loaded from (``None`` for data
+#: embedded in another document), its scalar ``fields`` with their wrappers
+#: applied, and ``links`` for the crawled relations. A link is the related
+#: model's URL, whose own snapshot is yielded separately, an embedded
+#: ``Snapshot``, ``None``, or for collections a list of those.
+Snapshot = collections.namedtuple('Snapshot', 'model url fields links')
+
+_plan = None
+
+
+def _make_plan(model, relations):
+    """Map every model class reached by ``relations`` to the relation fields
+    to follow from it, as ``{name: (is_collection, related model)}``."""
+    plan = {model: {}}
+    for lookup in relations:
+        current = model
+        for name in lookup.split('__'):
+            field = current.fields.get(name)
+            if not isinstance(field, APIModelField):
+                raise ValueError(
+                    '{0} is not a relation field of {1}'.format(
+                        name, current.__name__))
+            related = field.get_model(current)
+            plan[current][name] = (isinstance(field, APICollectionField),
+                                   related)
+            plan.setdefault(related, {})
+            current = related
+    return plan
+
+
+def _init_worker(plan):
+    global _plan
+    _plan = plan
+    # Forked workers must not share the parent's pooled connections or
+    # helper threads.
+    concurrency.set_executor(concurrency.SharedExecutor())
+    transports = {get_default_transport()}
+    transports.update(model.transport for model in plan
+                      if model.transport is not None)
+    for transport in transports:
+        transport.close()
+
+
+def _crawl_batch(tasks):
+    snapshots = []
+    found = []
+    errors = []
+    for model, url in tasks:
+        try:
+            snapshots.append(_snapshot(model, url, found))
+        except (NotFound, RequestException, ValueError) as e:
+            errors.append((url, e))
+    return snapshots, found, errors
+
+
+def _snapshot(model, data, found):
+    instance = model(data=data)
+    relations = _plan[model]
+    fields = {name: getattr(instance, name) for name, field
+              in model.fields.items() if not isinstance(field, APIModelField)}
+    links = {}
+    for name, (is_collection, related) in relations.items():
+        if is_collection:
+            field = model.fields[name]
+            value = field.url.format(instance) if field.url else \
+                instance._data.get(name)
+            if isinstance(value, str):
+                collection = APICollection(model=related, data=value)
+                collection._ensure_loaded()
+                value = list(collection._iter_data())
+            links[name] = None if value is None else \
+                [_link(related, item, found) for item in value]
+        else:
+            links[name] = _link(related, instance._data.get(name), found)
+    return Snapshot(model, instance._url, fields, links)
+
+
+def _link(model, data, found):
+    if isinstance(data, str):
+        found.append((model, data))
+        return data
+    if data is not None:
+        return _snapshot(model, data, found)
+
+
+class Crawler(object):
+    """Walks a graph of models on a process pool; see ``crawl``."""
+
+    def __init__(self, root, relations=(), processes=None, batch_size=16,
+                 max_pending=None, mp_context=None):
+        if isinstance(root, type):
+            root = root()
+        self.root = root
+        self.plan = _make_plan(root.model, relations)
+        self.processes = processes
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.mp_context = mp_context
+        self.visited = set()
+        self.errors = {}
+        self._queue = collections.deque()
+
+    def _enqueue(self, model, data):
+        if isinstance(data, str):
+            if data in self.visited:
+                return
+            self.visited.add(data)
+        self._queue.append((model, data))
+
+    def _next_batch(self, items):
+        while len(self._queue) < self.batch_size:
+            data = next(items, None)
+            if data is None:
+                break
+            self._enqueue(self.root.model, data)
+        batch = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        return batch
+
+    def __iter__(self):
+        self.root._ensure_loaded()
+        items = self.root._iter_data()
+        pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=self.mp_context,
+            initializer=_init_worker, initargs=(self.plan,))
+        max_pending = self.max_pending or \
+            2 * (self.processes or os.cpu_count() or 1)
+        running = set()
+        try:
+            while True:
+                while len(running) < max_pending:
+                    batch = self._next_batch(items)
+                    if not batch:
+                        break
+                    running.add(pool.submit(_crawl_batch, batch))
+                if not running:
+                    return
+                done, running = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    snapshots, found, errors = future.result()
+                    for model, url in found:
+                        self._enqueue(model, url)
+                    self.errors.update(errors)
+                    yield from snapshots
+        finally:
+            for future in running:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+
+def crawl(root, *relations, **kwargs):
+    """Load every model of the collection ``root`` and, following
+    ``relations`` (chained with ``__`` as for ``prefetch``), the models they
+    reach, fetching and decoding on a pool of worker processes.
+
+    Relations are followed from every instance of the model they start
+    from, so the crawl covers the whole graph the spec describes. The
+    calling process keeps the set of visited URLs and hands each one to a
+    worker once, in batches of ``batch_size``. At most ``max_pending``
+    batches are outstanding, so results stream back as ``Snapshot`` tuples
+    while the crawl continues. URLs that fail to load end up in the
+    returned ``Crawler``'s ``errors``.
+
+    Model classes must be importable by the worker processes.
+    """
+    return Crawler(root, relations, **kwargs)
@@ -0,0 +1,32 @@
+import contextlib
+import contextvars
+import time
+
+_deadline = contextvars.ContextVar('apimodel_deadline', default=None)
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """Give every load started in the block ``seconds`` in total.
+
+    The deadline follows the context into nested field loads, collection
+    fan-out and page prefetching, and every request's timeout is the time
+    left. A nested ``deadline`` can shorten the budget but never extend it.
+    """
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None and current < expires:
+        expires = current
+    token = _deadline.set(expires)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Return the seconds left before the current deadline, or ``None``."""
+    expires = _deadline.get()
+    if expires is None:
+        return None
+    return expires - time.monotonic()
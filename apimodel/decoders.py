@@ -0,0 +1,39 @@
+import json
+
+
+def stdlib_decode(content):
+    return json.loads(content)
+
+
+def _load_orjson():
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson.loads
+
+
+def available_decoders():
+    """Return the JSON decoders that can be used here, fastest first.
+
+    Each decoder takes a response body as ``bytes`` and returns the decoded
+    document, raising ``ValueError`` on invalid JSON.
+    """
+    decoders = {}
+    orjson_decode = _load_orjson()
+    if orjson_decode is not None:
+        decoders['orjson'] = orjson_decode
+    decoders['json'] = stdlib_decode
+    return decoders
+
+
+_default_decoder = next(iter(available_decoders().values()))
+
+
+def get_default_decoder():
+    return _default_decoder
+
+
+def set_default_decoder(decoder):
+    global _default_decoder
+    _default_decoder = decoder
@@ -0,0 +1,337 @@
+import bisect
+import contextvars
+import re
+import string
+import threading
+import time
+from urllib.parse import urlsplit
+
+_loading_field = contextvars.ContextVar('apimodel_loading_field',
+                                        default=None)
+_lock = threading.Lock()
+
+#: The registered observers. Loads check this before doing any timing, so
+#: instrumentation costs nothing while no observer is registered.
+observers = ()
+
+
+class Observer(object):
+    """Base class for objects notified of model loading events.
+
+    Subclass it, override the events of interest and register an instance
+    with ``add_observer``. Events are delivered synchronously on the thread
+    doing the work, so handlers should be quick and thread-safe.
+    """
+
+    def request_started(self, resource, url):
+        pass
+
+    def request_finished(self, resource, url, status, size, seconds,
+                         error=None):
+        pass
+
+    def response_decoded(self, resource, size, seconds):
+        pass
+
+    def cache_lookup(self, resource, url, result):
+        """``result`` is ``'hit'``, ``'stale'``, ``'expired'`` or
+        ``'miss'``."""
+
+    def field_loaded(self, model, name, seconds):
+        pass
+
+    def collection_fanout(self, collection, size):
+        pass
+
+
+def add_observer(observer):
+    global observers
+    with _lock:
+        observers = observers + (observer,)
+    return observer
+
+
+def remove_observer(observer):
+    global observers
+    with _lock:
+        observers = tuple(o for o in observers if o is not observer)
+
+
+def notify(event, *args):
+    for observer in observers:
+        getattr(observer, event)(*args)
+
+
+def loading_field():
+    """Return ``(model class, field name)`` of the field load in progress in
+    this context, or ``None``."""
+    return _loading_field.get()
+
+
+def observe_request(resource, url, func, *args, stream=False):
+    notify('request_started', resource, url)
+    start = time.perf_counter()
+    try:
+        response = func(*args)
+    except BaseException as e:
+        notify('request_finished', resource, url, None, 0,
+               time.perf_counter() - start, e)
+        raise
+    if stream:
+        # Reading the content would consume the stream; the size is only
+        # known when the server sends it.
+        size = int(response.headers.get('Content-Length') or 0)
+    else:
+        size = len(response.content or b'')
+    notify('request_finished', resource, url, response.status_code, size,
+           time.perf_counter() - start)
+    return response
+
+
+async def aobserve_request(resource, url, func, *args):
+    notify('request_started', resource, url)
+    start = time.perf_counter()
+    try:
+        response = await func(*args)
+    except BaseException as e:
+        notify('request_finished', resource, url, None, 0,
+               time.perf_counter() - start, e)
+        raise
+    notify('request_finished', resource, url, response.status_code,
+           len(response.content or b''), time.perf_counter() - start)
+    return response
+
+
+def observe_field(model, name, func, *args):
+    token = _loading_field.set((type(model), name))
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        _loading_field.reset(token)
+        notify('field_loaded', model, name, time.perf_counter() - start)
+
+
+class Histogram(object):
+    """Fixed-bucket latency histogram; ``bounds`` are in seconds."""
+
+    bounds = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5,
+              10)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.buckets[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        """Return the upper bound of the bucket holding ``percent``."""
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {'count': self.count, 'total': self.total, 'mean': self.mean,
+                'p50': self.percentile(50), 'p95': self.percentile(95),
+                'p99': self.percentile(99), 'max': self.max}
+
+
+_ID_SEGMENT = re.compile(r'^(?:\d+|(?=.*\d)[\w.~-]{8,})$')
+
+
+def url_template(url, templates=()):
+    """Return the first of ``templates`` that ``url`` was built from, or
+    the URL with its query dropped and id-like path segments (numbers, or
+    tokens of eight or more characters containing a digit) replaced by
+    ``{}``."""
+    for template, pattern in templates:
+        if pattern.match(url):
+            return template
+    parts = urlsplit(url)
+    path = '/'.join('{}' if _ID_SEGMENT.match(segment) else segment
+                    for segment in parts.path.split('/'))
+    return '{0}://{1}{2}'.format(parts.scheme, parts.netloc, path)
+
+
+def _template_pattern(template):
+    pattern = ''.join(
+        re.escape(literal) + ('[^/?#]+' if field is not None else '')
+        for literal, field, _, _ in string.Formatter().parse(template))
+    return re.compile(pattern + r'(?:[?#]|$)')
+
+
+class MetricsCollector(Observer):
+    """In-process metrics for every fetch, decode and field load.
+
+    Keeps request latency histograms per resource class and per URL
+    template (taken from the class's ``finders`` and ``url`` where they
+    match), cache and byte counters, field load timings and collection
+    fan-out sizes. ``summary()`` renders a report that also flags likely
+    N+1 access: a relation field whose separate loads each made a request,
+    ``n_plus_one_threshold`` times or more.
+    """
+
+    def __init__(self, n_plus_one_threshold=10):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        self._templates = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.errors = 0
+            self.bytes = 0
+            self.decode_seconds = 0.0
+            self.cache = {'hit': 0, 'stale': 0, 'expired': 0, 'miss': 0}
+            self.by_resource = {}
+            self.by_template = {}
+            self.fields = {}
+            self.field_requests = {}
+            self.fanout = Histogram()
+
+    def install(self):
+        return add_observer(self)
+
+    def uninstall(self):
+        remove_observer(self)
+
+    def _resource_name(self, resource):
+        name = type(resource).__name__
+        model = getattr(resource, '__dict__', {}).get(
+            'model', getattr(type(resource), 'model', None))
+        if isinstance(model, type):
+            name = '{0}[{1}]'.format(name, model.__name__)
+        return name
+
+    def _url_template(self, resource, url):
+        cls = type(resource)
+        templates = self._templates.get(cls)
+        if templates is None:
+            candidates = list(getattr(cls, 'finders', {}).values())
+            candidates += list(getattr(cls, 'batch_finders', {}).values())
+            if isinstance(getattr(cls, 'url', None), str):
+                candidates.append(cls.url)
+            templates = self._templates[cls] = [
+                (template, _template_pattern(template))
+                for template in candidates]
+        return url_template(url, templates)
+
+    def request_finished(self, resource, url, status, size, seconds,
+                         error=None):
+        name = self._resource_name(resource)
+        template = self._url_template(resource, url)
+        parent = loading_field()
+        with self._lock:
+            self.requests += 1
+            self.bytes += size
+            if error is not None or status is None or status >= 400:
+                self.errors += 1
+            for histograms, key in ((self.by_resource, name),
+                                    (self.by_template, template)):
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histogram = histograms[key] = Histogram()
+                histogram.add(seconds)
+            if parent is not None:
+                self.field_requests[parent] = \
+                    self.field_requests.get(parent, 0) + 1
+
+    def response_decoded(self, resource, size, seconds):
+        with self._lock:
+            self.decode_seconds += seconds
+
+    def cache_lookup(self, resource, url, result):
+        with self._lock:
+            self.cache[result] += 1
+
+    def field_loaded(self, model, name, seconds):
+        key = (type(model), name)
+        with self._lock:
+            histogram = self.fields.get(key)
+            if histogram is None:
+                histogram = self.fields[key] = Histogram()
+            histogram.add(seconds)
+
+    def collection_fanout(self, collection, size):
+        with self._lock:
+            self.fanout.add(size)
+
+    def n_plus_one(self):
+        """Return ``(model class, field name, requests)`` for every field
+        whose loads look like N+1 access, worst first."""
+        with self._lock:
+            suspects = [(cls, name, count)
+                        for (cls, name), count in self.field_requests.items()
+                        if count >= self.n_plus_one_threshold]
+        return sorted(suspects, key=lambda suspect: -suspect[2])
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'bytes': self.bytes,
+                'decode_seconds': self.decode_seconds,
+                'cache': dict(self.cache),
+                'by_resource': {key: histogram.as_dict() for key, histogram
+                                in self.by_resource.items()},
+                'by_template': {key: histogram.as_dict() for key, histogram
+                                in self.by_template.items()},
+                'fields': {'{0}.{1}'.format(cls.__name__, name):
+                           histogram.as_dict() for (cls, name), histogram
+                           in self.fields.items()},
+                'fanout': {'count': self.fanout.count,
+                           'total': int(self.fanout.total),
+                           'max': int(self.fanout.max)},
+            }
+
+    def summary(self):
+        data = self.snapshot()
+        lines = ['{requests} requests ({errors} failed), {bytes} bytes, '
+                 '{decode:.3f}s decoding'.format(
+                     decode=data['decode_seconds'], **data),
+                 'cache: {hit} hits, {stale} stale, {expired} expired, '
+                 '{miss} misses'.format(**data['cache']),
+                 'collections: {count} fan-outs, {total} models, largest '
+                 '{max}'.format(**data['fanout'])]
+        for title, rows in (('resource', data['by_resource']),
+                            ('URL template', data['by_template']),
+                            ('field load', data['fields'])):
+            if not rows:
+                continue
+            lines.append('')
+            lines.append('{0:<48} {1:>7} {2:>9} {3:>9} {4:>9}'.format(
+                'latency by ' + title, 'count', 'p50 ms', 'p95 ms',
+                'max ms'))
+            for key, row in sorted(rows.items(),
+                                   key=lambda item: -item[1]['total']):
+                lines.append('{0:<48} {1:>7} {2:>9.1f} {3:>9.1f} '
+                             '{4:>9.1f}'.format(
+                                 key, row['count'], row['p50'] * 1000,
+                                 row['p95'] * 1000, row['max'] * 1000))
+        suspects = self.n_plus_one()
+        if suspects:
+            lines.append('')
+            lines.append('possible N+1 access:')
+            for cls, name, count in suspects:
+                lines.append(
+                    '  {0}.{1} made {2} requests from separate field loads; '
+                    'load it with collection.prefetch({1!r}) or '
+                    'get_many()'.format(cls.__name__, name, count))
+        return '\n'.join(lines)
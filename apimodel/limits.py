@@ -0,0 +1,208 @@
+import contextlib
+import email.utils
+import threading
+import time
+from urllib.parse import urlparse
+
+from requests.exceptions import Timeout
+
+from . import deadlines
+from .instrumentation import url_template
+
+
+def retry_after(headers):
+    """Return the seconds a ``Retry-After`` header asks to wait, or
+    ``None``."""
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+def _key(url, per):
+    if per == 'template':
+        return url_template(url)
+    return urlparse(url).netloc
+
+
+class TokenBucket(object):
+    """Allows ``rate`` acquisitions per second, in bursts of up to
+    ``burst``."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst if burst is not None else max(1.0, self.rate)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how long to wait before using it.
+
+        Tokens are reserved in order, so concurrent callers are spaced out
+        instead of all waking at once.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait <= 0:
+            return
+        left = deadlines.remaining()
+        if left is not None and wait > left:
+            with self._lock:
+                self._tokens += 1
+            raise Timeout('Deadline passed waiting for the rate limit')
+        time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until,
+                                     time.monotonic() + seconds)
+
+
+class RateLimiter(object):
+    """Client-side rate limit shared by every thread using it.
+
+    Each host (or, with ``per='template'``, each URL template) gets its own
+    ``TokenBucket`` of ``rate`` requests per second. ``pause`` holds back a
+    key's requests, for example for a server's ``Retry-After``.
+    """
+
+    def __init__(self, rate, burst=None, per='host'):
+        if per not in ('host', 'template'):
+            raise ValueError('per must be "host" or "template"')
+        self.rate = rate
+        self.burst = burst
+        self.per = per
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url):
+        key = _key(url, self.per)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = TokenBucket(self.rate,
+                                                              self.burst)
+        return bucket
+
+    def reserve(self, url):
+        return self.bucket(url).reserve()
+
+    def acquire(self, url):
+        self.bucket(url).acquire()
+
+    def pause(self, url, seconds):
+        self.bucket(url).pause(seconds)
+
+
+class _Slot(object):
+    __slots__ = ('ok',)
+
+    def __init__(self):
+        self.ok = True
+
+
+class _HostLimit(object):
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.decreased = 0.0
+        self.condition = threading.Condition()
+
+
+class AdaptiveLimiter(object):
+    """AIMD limit on concurrent requests per host.
+
+    Every successful request raises a host's limit by ``1 / limit``, about
+    one more request per round trip, up to ``maximum``. A failed or
+    throttled request, or one slower than ``target_latency``, multiplies it
+    by ``backoff``, at most once per round trip, down to ``minimum``.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=100,
+                 target_latency=None, backoff=0.5):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _HostLimit(self.initial)
+            return state
+
+    def limit(self, url):
+        return self._host(url).limit
+
+    @contextlib.contextmanager
+    def slot(self, url):
+        """Wait for a free slot for ``url``'s host and hold it.
+
+        Set ``ok = False`` on the yielded slot to report a throttled or
+        failed response; exceptions count as failures. Raises
+        ``requests.Timeout`` if the deadline passes while waiting.
+        """
+        state = self._host(url)
+        left = deadlines.remaining()
+        expires = None if left is None else time.monotonic() + left
+        with state.condition:
+            while state.in_flight >= int(state.limit):
+                if expires is None:
+                    state.condition.wait()
+                    continue
+                left = expires - time.monotonic()
+                if left <= 0:
+                    raise Timeout(
+                        'Deadline passed waiting for a slot for {0}'.format(
+                            urlparse(url).netloc))
+                state.condition.wait(left)
+            state.in_flight += 1
+        slot = _Slot()
+        start = time.monotonic()
+        try:
+            yield slot
+        except BaseException:
+            slot.ok = False
+            raise
+        finally:
+            self._record(state, time.monotonic() - start, slot.ok)
+
+    def _record(self, state, seconds, ok):
+        with state.condition:
+            state.in_flight -= 1
+            now = time.monotonic()
+            slow = self.target_latency is not None and \
+                seconds > self.target_latency
+            if ok and not slow:
+                state.limit = min(self.maximum,
+                                  state.limit + 1.0 / state.limit)
+            elif now - state.decreased > seconds:
+                state.limit = max(self.minimum, state.limit * self.backoff)
+                state.decreased = now
+            state.condition.notify_all()
@@ -0,0 +1,105 @@
+import collections
+import threading
+from urllib.parse import urljoin
+
+from requests.utils import parse_header_links
+
+
+def _lookup(data, path):
+    for key in path.split('.'):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+class Paginator(object):
+    """Describes how a paginated collection endpoint splits its results.
+
+    ``items`` and ``next`` are dotted paths into each page's JSON object
+    (``items=None`` means the page itself is the list of elements). When
+    the page carries no next link, a ``Link: <...>; rel="next"`` response
+    header is used instead. ``count`` names a field holding the total number
+    of elements, and ``prefetch`` is how many pages are fetched in the
+    background ahead of the page being consumed.
+    """
+
+    def __init__(self, items='results', next='next', count='count',
+                 link_header=True, prefetch=1):
+        self.items_path = items
+        self.next_path = next
+        self.count_path = count
+        self.link_header = link_header
+        self.prefetch = prefetch
+
+    def items(self, page):
+        if self.items_path is None or isinstance(page, list):
+            return page
+        items = _lookup(page, self.items_path)
+        if items is None:
+            raise ValueError('No "{0}" list in page'.format(self.items_path))
+        return items
+
+    def next_url(self, page, headers, url):
+        next_url = None
+        if self.next_path is not None:
+            next_url = _lookup(page, self.next_path)
+        if not next_url and self.link_header and headers:
+            for link in parse_header_links(headers.get('Link', '')):
+                if link.get('rel') == 'next':
+                    next_url = link.get('url')
+                    break
+        if next_url:
+            return urljoin(url, next_url)
+
+    def total(self, page):
+        if self.count_path is not None:
+            total = _lookup(page, self.count_path)
+            if isinstance(total, int):
+                return total
+
+
+class PageStream(object):
+    """Iterates the pages of a collection, prefetching ahead in the background.
+
+    Page fetches are deferred on the shared executor. Each fetch schedules
+    the next page itself while fewer than ``paginator.prefetch`` pages are
+    waiting to be consumed, so the chain of next links is followed ahead of
+    the consumer without holding more than that many pages in memory.
+    """
+
+    def __init__(self, collection, url):
+        self.collection = collection
+        self.paginator = collection.get_paginator()
+        self.executor = collection.get_executor()
+        self._pending = collections.deque()
+        self._resume = None
+        self._lock = threading.Lock()
+        if url:
+            self._schedule(url)
+
+    def _schedule(self, url):
+        self._pending.append(self.executor.defer(self._fetch, url))
+
+    def _fetch(self, url):
+        page, headers = self.collection._fetch(url)
+        next_url = self.paginator.next_url(page, headers, url)
+        with self._lock:
+            if next_url and len(self._pending) < self.paginator.prefetch:
+                self._schedule(next_url)
+            else:
+                self._resume = next_url
+        return self.collection._page_items(page)
+
+    def __iter__(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                deferred = self._pending.popleft()
+            items = deferred.result()
+            with self._lock:
+                if self._resume:
+                    self._schedule(self._resume)
+                    self._resume = None
+            yield items
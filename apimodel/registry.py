@@ -0,0 +1,100 @@
+import threading
+import weakref
+
+
+class ModelRegistry(object):
+    """Maps model names to classes so string references resolve once.
+
+    Relation fields that name their model with a string, such as
+    ``APIModelField(model='Egg')`` or ``model='shop.models.Egg'``, are
+    resolved as soon as a matching model class is registered. A bare name
+    is matched eagerly only against the declaring class's module; a unique
+    model with that name elsewhere is accepted on first load or by
+    ``validate()``, once every module has had a chance to register.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._pending = []
+        self._lock = threading.RLock()
+
+    def register(self, cls):
+        with self._lock:
+            self._models.setdefault(cls.__name__, weakref.WeakSet()).add(cls)
+            for field in list(self._pending):
+                self._resolve(field, eager=True)
+
+    def defer(self, field):
+        with self._lock:
+            if isinstance(field.wrapper_func, str) and \
+                    field not in self._pending:
+                self._pending.append(field)
+                self._resolve(field, eager=True)
+
+    def resolve(self, field, module=None):
+        with self._lock:
+            return self._resolve(field, module)
+
+    def bind(self, field, cls):
+        with self._lock:
+            field.wrapper_func = cls
+            if field in self._pending:
+                self._pending.remove(field)
+
+    def _resolve(self, field, module=None, eager=False):
+        name = field.wrapper_func
+        if not isinstance(name, str):
+            return name
+        owner = getattr(field, 'owner', None)
+        if owner is not None:
+            module = owner.__module__
+        cls = self.lookup(name, module, local_only=eager)
+        if cls is not None:
+            self.bind(field, cls)
+        return cls
+
+    def lookup(self, name, module=None, local_only=False):
+        module_name, _, class_name = name.rpartition('.')
+        candidates = list(self._models.get(class_name, ()))
+        if module_name:
+            candidates = [cls for cls in candidates
+                          if cls.__module__ == module_name]
+        elif module is not None or local_only:
+            local = [cls for cls in candidates if cls.__module__ == module]
+            candidates = local if local or local_only else candidates
+        if len(candidates) == 1:
+            return candidates[0]
+
+    def unresolved(self):
+        with self._lock:
+            return list(self._pending)
+
+    def validate(self):
+        """Raise ``ValueError`` naming every string reference left unresolved.
+
+        Call this once all model modules are imported, for example at
+        application startup, to catch typos before the first field load.
+        """
+        errors = []
+        for field in self.unresolved():
+            if self.resolve(field) is not None:
+                continue
+            name = field.wrapper_func
+            matches = len(self._models.get(name.rpartition('.')[2], ()))
+            errors.append('{0}.{1} refers to {2} model "{3}"'.format(
+                field.owner.__name__, field.name,
+                'ambiguous' if matches > 1 else 'unknown', name))
+        if errors:
+            raise ValueError('Unresolved model references: {0}'.format(
+                '; '.join(errors)))
+
+
+_default_registry = ModelRegistry()
+
+
+def get_registry():
+    return _default_registry
+
+
+def validate_models():
+    get_registry().validate()
@@ -0,0 +1,51 @@
+import contextvars
+import threading
+
+_current = contextvars.ContextVar('apimodel_session', default=None)
+
+
+class Session(object):
+    """Identity map scoping model instances to a block of code.
+
+    Within ``with Session():``, constructing a model by URL or finder key
+    returns the instance already built for that URL, so every reference to
+    a remote resource shares one object and one fetch. The session follows
+    the context into collection worker threads.
+    """
+
+    def __init__(self):
+        self._instances = {}
+        self._lock = threading.Lock()
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(_current.set(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        _current.reset(self._tokens.pop())
+
+    def __len__(self):
+        return len(self._instances)
+
+    def __contains__(self, key):
+        return key in self._instances
+
+    def get(self, key):
+        return self._instances.get(key)
+
+    def add(self, key, instance):
+        with self._lock:
+            return self._instances.setdefault(key, instance)
+
+    def discard(self, key):
+        with self._lock:
+            self._instances.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._instances.clear()
+
+
+def current_session():
+    return _current.get()
@@ -0,0 +1,95 @@
+import codecs
+import json
+import re
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# A number decoded up to one of these may continue in the next chunk.
+_NUMBER_CONTINUATION = frozenset('.eE+-0123456789')
+_decoder = json.JSONDecoder()
+
+
+class _Reader(object):
+    def __init__(self, chunks, compact_at=1 << 16):
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._compact_at = compact_at
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        if self.pos > self._compact_at:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        for chunk in self._chunks:
+            if chunk:
+                self.buf += self._text.decode(chunk)
+                return True
+        self.buf += self._text.decode(b'', final=True)
+        self.eof = True
+        return False
+
+    def peek(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError('Unexpected end of JSON stream')
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError('Expected {0!r} at position {1} of JSON stream, '
+                             'found {2!r}'.format(chars, self.pos, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self.fill():
+                    raise
+                continue
+            if not self.eof and (end == len(self.buf) or
+                                 self.buf[end] in _NUMBER_CONTINUATION) \
+                    and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(chunks, path=None):
+    """Yield the elements of a JSON array as they arrive in ``chunks``.
+
+    ``chunks`` is any iterable of UTF-8 byte strings, such as
+    ``response.iter_content()``. With ``path``, a dotted list of keys, the
+    array is found inside enclosing objects; values of other keys along
+    the way are decoded and discarded. Only one element is held in memory
+    at a time, besides the undecoded input buffer.
+    """
+    reader = _Reader(chunks)
+    for key in path.split('.') if path else ():
+        reader.expect('{')
+        if reader.peek() == '}':
+            raise ValueError('No "{0}" key in JSON stream'.format(key))
+        while True:
+            name = reader.value()
+            reader.expect(':')
+            if name == key:
+                break
+            reader.value()
+            if reader.expect(',}') == '}':
+                raise ValueError('No "{0}" key in JSON stream'.format(key))
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        yield reader.value()
+        if reader.expect(',]') == ']':
+            return
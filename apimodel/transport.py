@@ -0,0 +1,255 @@
+import collections
+import concurrent.futures
+import contextvars
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import deadlines
+from .limits import retry_after
+
+RETRY_STATUSES = (429, 503)
+
+
+def _time_left(timeout):
+    """Cap ``timeout`` to the time left on the deadline, which may have
+    shrunk while waiting for the rate limit or a slot."""
+    left = deadlines.remaining()
+    if left is None or not isinstance(timeout, (int, float, type(None))):
+        return timeout
+    if left <= 0:
+        raise requests.Timeout('Deadline passed before sending the request')
+    return left if timeout is None else min(timeout, left)
+
+
+class Transport(object):
+    """Pooled keep-alive HTTP transport shared by every model that uses it.
+
+    A single ``requests.Session`` is created lazily and reused, so repeated
+    fetches against the same host reuse open connections instead of paying
+    for a new TCP/TLS handshake each time. With ``compress`` (the default)
+    gzip and deflate response encodings are requested and decoded
+    transparently; ``compress=False`` asks for uncompressed bodies.
+
+    Every request first waits for ``rate_limiter`` (a ``RateLimiter``) and a
+    slot from ``concurrency`` (an ``AdaptiveLimiter``), when given. ``429``
+    and ``503`` responses are retried up to ``retries`` times, after the
+    ``Retry-After`` delay or an exponential backoff, unless that wait is
+    longer than ``max_retry_wait`` or than the time left on a deadline.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False,
+                 timeout=None, headers=None, compress=True, rate_limiter=None,
+                 concurrency=None, retries=2, max_retry_wait=30):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.timeout = timeout
+        self.compress = compress
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.retries = retries
+        self.max_retry_wait = max_retry_wait
+        self.headers = {
+            'Accept-Encoding': 'gzip, deflate' if compress else 'identity'}
+        self.headers.update(headers or {})
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self.create_session()
+        return self._session
+
+    def create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update(self.headers)
+        return session
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        if timeout is None:
+            timeout = self.timeout
+        attempt = 0
+        while True:
+            response = self._send(url, headers, timeout, stream)
+            if response.status_code not in RETRY_STATUSES or \
+                    attempt >= self.retries:
+                return response
+            wait = retry_after(response.headers)
+            if wait is None:
+                wait = 0.5 * 2 ** attempt
+            left = deadlines.remaining()
+            if wait > self.max_retry_wait or (left is not None and
+                                              wait >= left):
+                return response
+            response.close()
+            if self.rate_limiter is not None:
+                self.rate_limiter.pause(url, wait)
+            else:
+                time.sleep(wait)
+            if left is not None and isinstance(timeout, (int, float)):
+                timeout = min(timeout, deadlines.remaining())
+            attempt += 1
+
+    def _send(self, url, headers, timeout, stream):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(url)
+        if self.concurrency is None:
+            return self.session.get(url, headers=headers,
+                                    timeout=_time_left(timeout),
+                                    stream=stream)
+        with self.concurrency.slot(url) as slot:
+            response = self.session.get(url, headers=headers,
+                                        timeout=_time_left(timeout),
+                                        stream=stream)
+            slot.ok = response.status_code < 500 and \
+                response.status_code != 429
+            return response
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class HedgedTransport(Transport):
+    """Transport that races a duplicate GET against a slow one.
+
+    Once a request has been outstanding for longer than the ``percentile``
+    of recent latencies to its host, the same request is sent again and the
+    first response to arrive is used. Until ``min_samples`` latencies have
+    been seen for a host, the hedge is sent after ``after`` seconds, or not
+    at all if ``after`` is ``None``. Requests run on up to ``max_workers``
+    helper threads, which should exceed the number of concurrent callers.
+    """
+
+    def __init__(self, percentile=95, after=None, min_samples=20, window=200,
+                 max_workers=64, **kwargs):
+        super(HedgedTransport, self).__init__(**kwargs)
+        self.percentile = percentile
+        self.after = after
+        self.min_samples = min_samples
+        self.window = window
+        self.max_workers = max_workers
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._latencies = {}
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix='apimodel-hedge')
+        return self._pool
+
+    def hedge_delay(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            samples = sorted(self._latencies.get(host, ()))
+        if len(samples) < self.min_samples:
+            return self.after
+        index = int(len(samples) * self.percentile / 100.0)
+        return samples[min(index, len(samples) - 1)]
+
+    def _record(self, url, seconds):
+        host = urlparse(url).netloc
+        with self._lock:
+            latencies = self._latencies.get(host)
+            if latencies is None:
+                latencies = self._latencies[host] = collections.deque(
+                    maxlen=self.window)
+            latencies.append(seconds)
+
+    def _timed_get(self, url, **kwargs):
+        start = time.monotonic()
+        response = super(HedgedTransport, self).get(url, **kwargs)
+        self._record(url, time.monotonic() - start)
+        return response
+
+    def _submit(self, url, headers, timeout):
+        # Each request runs in a copy of the caller's context so it sees the
+        # caller's deadline.
+        return self.pool.submit(contextvars.copy_context().run,
+                                self._timed_get, url, headers=headers,
+                                timeout=timeout)
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        delay = None if stream else self.hedge_delay(url)
+        if delay is None:
+            return self._timed_get(url, headers=headers, timeout=timeout,
+                                   stream=stream)
+        left = deadlines.remaining()
+        primary = self._submit(url, headers, timeout)
+        done, _ = concurrent.futures.wait(
+            [primary], timeout=delay if left is None else min(delay, left))
+        if done:
+            return primary.result()
+        left = deadlines.remaining()
+        if left is not None and left <= 0:
+            primary.add_done_callback(_close_response)
+            raise requests.Timeout('Deadline passed waiting for {0}'.format(
+                url))
+        hedge = self._submit(url, headers, timeout)
+        with self._lock:
+            self.hedged += 1
+        error = None
+        try:
+            for future in concurrent.futures.as_completed([primary, hedge],
+                                                          timeout=left):
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if future is hedge:
+                    with self._lock:
+                        self.hedge_wins += 1
+                (primary if future is hedge else hedge).add_done_callback(
+                    _close_response)
+                return response
+        except concurrent.futures.TimeoutError:
+            for future in (primary, hedge):
+                future.add_done_callback(_close_response)
+            raise requests.Timeout('Deadline passed waiting for {0}'.format(
+                url))
+        raise error
+
+    def close(self):
+        super(HedgedTransport, self).close()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+
+_default_transport = Transport()
+
+
+def get_default_transport():
+    return _default_transport
+
+
+def set_default_transport(transport):
+    global _default_transport
+    _default_transport = transport
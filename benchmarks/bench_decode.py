@@ -0,0 +1,90 @@
+"""Compare the available JSON decoders and compressed transfer encodings.
+
+Usage: python benchmarks/bench_decode.py [--items N] [--repeat N]
+
+A synthetic collection payload is decoded from bytes with every decoder in
+``apimodel.available_decoders()``, and its size and decode cost are reported
+for the identity, gzip and deflate encodings negotiated by ``Transport``.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import timeit
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apimodel import available_decoders  # noqa: E402
+
+
+def make_payload(items):
+    return json.dumps([{
+        'egg_id': 'egg-{0}'.format(i),
+        'basket_id': 'basket-{0}'.format(i % 50),
+        'weight': 50 + i % 20,
+        'organic': i % 3 == 0,
+        'laid_at': '2026-03-02T10:{0:02d}:00Z'.format(i % 60),
+        'notes': 'Laid in the north coop, collected by hand ' * 2,
+        'tags': ['fresh', 'large', 'brown'][:i % 4],
+    } for i in range(items)]).encode()
+
+
+ENCODINGS = {
+    'identity': (lambda body: body, lambda body: body),
+    'gzip': (gzip.compress, gzip.decompress),
+    'deflate': (zlib.compress, zlib.decompress),
+}
+
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def run(items, repeat):
+    payload = make_payload(items)
+    results = {'items': items, 'bytes': len(payload), 'decoders': {},
+               'encodings': {}}
+    for name, decode in available_decoders().items():
+        results['decoders'][name] = best_of(lambda: decode(payload), repeat)
+    fastest = min(results['decoders'], key=results['decoders'].get)
+    decode = available_decoders()[fastest]
+    for name, (compress, decompress) in ENCODINGS.items():
+        body = compress(payload)
+        results['encodings'][name] = {
+            'bytes': len(body),
+            'seconds': best_of(lambda: decode(decompress(body)), repeat),
+        }
+    return results
+
+
+def report(results):
+    print('{items} items, {bytes} bytes of JSON'.format(**results))
+    print()
+    print('{0:<10} {1:>12}'.format('decoder', 'ms'))
+    for name, seconds in sorted(results['decoders'].items(),
+                                key=lambda item: item[1]):
+        print('{0:<10} {1:>12.2f}'.format(name, seconds * 1000))
+    print()
+    print('{0:<10} {1:>12} {2:>12}'.format('encoding', 'bytes', 'ms'))
+    for name, result in results['encodings'].items():
+        print('{0:<10} {1:>12} {2:>12.2f}'.format(
+            name, result['bytes'], result['seconds'] * 1000))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+    results = run(args.items, args.repeat)
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""Benchmark apimodel against a local stand-in API server.
+
+Usage: python benchmarks/run.py [--latency SECONDS] [--payload BYTES]
+                                [--output results.json]
+                                [--compare baseline.json]
+
+Measures single lookups, collection fan-out, nested relation traversal,
+memory per model and decode time, prints a table and, with ``--output``,
+writes the results as JSON. ``--compare`` prints each timing next to the
+one recorded in an earlier results file.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import apimodel  # noqa: E402
+from apimodel import APICollection, APICollectionField, APIField, \
+    APIModel, APIModelField  # noqa: E402
+from apimodel.concurrency import configure  # noqa: E402
+from apimodel.instrumentation import Histogram  # noqa: E402
+
+from bench_decode import run as run_decode  # noqa: E402
+from server import serve  # noqa: E402
+
+
+def make_models(base_url):
+    class Candy(APIModel):
+        fields = {
+            'candy_id': APIField(str),
+        }
+
+    class Egg(APIModel):
+        fields = {
+            'egg_id': APIField(str),
+            'basket_id': APIField(str),
+            'weight': APIField(int),
+            'notes': APIField(str),
+            'candy': APIModelField(Candy),
+        }
+
+        finders = {
+            'egg_id': base_url + '/v1/eggs/{0}/',
+        }
+
+    class CompactEgg(Egg):
+        compact = True
+
+    class Basket(APIModel):
+        fields = {
+            'basket_id': APIField(str),
+            'egg': APIModelField(Egg),
+            'eggs': APICollectionField(Egg),
+            'candies': APICollectionField(Candy),
+        }
+
+        finders = {
+            'basket_id': base_url + '/v1/baskets/{0}/',
+        }
+
+    return Egg, CompactEgg, Basket
+
+
+def timed(server, func):
+    requests = server.requests
+    start = time.perf_counter()
+    func()
+    return {'seconds': time.perf_counter() - start,
+            'requests': server.requests - requests}
+
+
+def bench_single_lookup(server, Egg, count):
+    histogram = Histogram()
+    requests = server.requests
+    start = time.perf_counter()
+    for i in range(count):
+        began = time.perf_counter()
+        Egg(egg_id=i % server.eggs).egg_id
+        histogram.add(time.perf_counter() - began)
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'requests': server.requests - requests,
+            'lookups_per_second': count / seconds,
+            'p50': histogram.percentile(50), 'p95': histogram.percentile(95),
+            'max': histogram.max}
+
+
+def bench_fanout(server, Egg):
+    collection = APICollection(model=Egg, data=server.base_url + '/v1/eggs/')
+    result = timed(server, collection.all)
+    result['models'] = len(collection.all())
+    return result
+
+
+def bench_traversal(server, Basket, prefetch):
+    def traverse():
+        baskets = APICollection(model=Basket,
+                                data=server.base_url + '/v1/baskets/')
+        if prefetch:
+            baskets.prefetch('eggs__candy', 'egg')
+        for basket in baskets:
+            basket.egg.egg_id
+            for egg in basket.eggs:
+                egg.candy.candy_id
+
+    return timed(server, traverse)
+
+
+def bench_memory(server, model):
+    url = server.base_url + '/v1/eggs/?inline=1'
+    collection = APICollection(model=model, data=url)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    models = collection.all()
+    for egg in models:
+        egg.egg_id, egg.basket_id, egg.weight, egg.notes, egg.candy
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return {'models': len(models), 'bytes_per_model': used / len(models)}
+
+
+def run(args):
+    configure(max_workers=args.workers)
+    with serve(latency=args.latency, jitter=args.jitter,
+               payload=args.payload, baskets=args.baskets,
+               eggs_per_basket=args.eggs_per_basket) as server:
+        Egg, CompactEgg, Basket = make_models(server.base_url)
+        results = {
+            'single_lookup': bench_single_lookup(server, Egg, args.lookups),
+            'collection_fanout': bench_fanout(server, Egg),
+            'nested_traversal': bench_traversal(server, Basket, False),
+            'nested_traversal_prefetch': bench_traversal(server, Basket,
+                                                         True),
+            'memory': bench_memory(server, Egg),
+            'memory_compact': bench_memory(server, CompactEgg),
+        }
+    decode = run_decode(args.decode_items, args.repeat)
+    results['decode'] = {'seconds': min(decode['decoders'].values()),
+                         'decoders': decode['decoders'],
+                         'bytes': decode['bytes']}
+    return {'meta': metadata(), 'params': vars(args), 'results': results}
+
+
+def metadata():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'commit': commit,
+            'decoder': apimodel.get_default_decoder().__module__}
+
+
+def report(data, baseline=None):
+    old = baseline['results'] if baseline else {}
+    print('{0:<28} {1:>10} {2:>9} {3:>12}'.format(
+        'benchmark', 'ms', 'requests', 'vs baseline'))
+    for name, result in data['results'].items():
+        if 'seconds' not in result:
+            continue
+        change = ''
+        if 'seconds' in old.get(name, {}):
+            change = '{0:.2f}x'.format(result['seconds'] /
+                                       old[name]['seconds'])
+        print('{0:<28} {1:>10.1f} {2:>9} {3:>12}'.format(
+            name, result['seconds'] * 1000, result.get('requests', ''),
+            change))
+    print()
+    for name in ('memory', 'memory_compact'):
+        result = data['results'][name]
+        change = ''
+        if name in old:
+            change = '{0:.2f}x'.format(result['bytes_per_model'] /
+                                       old[name]['bytes_per_model'])
+        print('{0:<28} {1:>10.0f} bytes per model {2}'.format(
+            name, result['bytes_per_model'], change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='server delay per response, in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='extra random delay of up to this many seconds')
+    parser.add_argument('--payload', type=int, default=512,
+                        help='approximate size of each egg, in bytes')
+    parser.add_argument('--baskets', type=int, default=20)
+    parser.add_argument('--eggs-per-basket', type=int, default=10)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--decode-items', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', help='an earlier results file')
+    args = parser.parse_args(argv)
+    output, compare = args.output, args.compare
+    del args.output, args.compare
+    data = run(args)
+    baseline = None
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+    report(data, baseline)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""A local stand-in for a basket/egg/candy API, for benchmarks.
+
+Routes (all JSON):
+
+    /v1/baskets/<id>/        a basket linking to ``eggs_per_basket`` eggs
+    /v1/baskets/             every basket, inline
+    /v1/eggs/<id>/           one egg, padded to roughly ``payload`` bytes
+    /v1/eggs/                links to every egg
+    /v1/eggs/?inline=1       every egg, inline
+
+Every response is delayed by ``latency`` seconds plus up to ``jitter``
+seconds, to stand in for network and upstream time.
+"""
+import contextlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class APIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, jitter=0.0,
+                 payload=256, baskets=10, eggs_per_basket=10):
+        super().__init__(address, Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.payload = payload
+        self.baskets = baskets
+        self.eggs_per_basket = eggs_per_basket
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return 'http://{0}:{1}'.format(*self.server_address)
+
+    @property
+    def eggs(self):
+        return self.baskets * self.eggs_per_basket
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def egg(self, egg_id):
+        egg = {'egg_id': str(egg_id),
+               'basket_id': str(egg_id // self.eggs_per_basket),
+               'weight': 50 + egg_id % 20,
+               'candy': {'candy_id': 'candy-{0}'.format(egg_id % 7)}}
+        padding = self.payload - len(json.dumps(egg))
+        egg['notes'] = 'x' * max(padding - 12, 0)
+        return egg
+
+    def basket(self, basket_id):
+        first = basket_id * self.eggs_per_basket
+        eggs = ['{0}/v1/eggs/{1}/'.format(self.base_url, egg_id)
+                for egg_id in range(first, first + self.eggs_per_basket)]
+        return {'basket_id': str(basket_id), 'eggs': eggs, 'egg': eggs[0],
+                'candies': [{'candy_id': 'candy-{0}'.format(basket_id)}]}
+
+    def route(self, path, query):
+        parts = [part for part in path.split('/') if part]
+        if parts[:2] == ['v1', 'eggs']:
+            if len(parts) == 2:
+                if query.get('inline'):
+                    return [self.egg(i) for i in range(self.eggs)]
+                return ['{0}/v1/eggs/{1}/'.format(self.base_url, i)
+                        for i in range(self.eggs)]
+            egg_id = int(parts[2])
+            if egg_id < self.eggs:
+                return self.egg(egg_id)
+        elif parts[:2] == ['v1', 'baskets']:
+            if len(parts) == 2:
+                return [self.basket(i) for i in range(self.baskets)]
+            basket_id = int(parts[2])
+            if basket_id < self.baskets:
+                return self.basket(basket_id)
+        return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+        url = urlsplit(self.path)
+        try:
+            document = server.route(url.path, parse_qs(url.query))
+        except ValueError:
+            document = None
+        if document is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps(document).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve(**options):
+    """Run an ``APIServer`` on a free local port for the ``with`` block."""
+    server = APIServer(**options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
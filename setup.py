@@ -10,4 +10,9 @@ setup(
     author_email='ethanmcc@gmail.com',
     url='http://github.com/ethanmcc/apimodel',
     keywords=['python', 'django', 'rest', 'api', 'model'],
+    install_requires=['requests'],
+    extras_require={
+        'async': ['aiohttp'],
+        'numpy': ['numpy'],
+    },
 )
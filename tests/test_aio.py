@@ -0,0 +1,337 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, skipIf
+import asyncio
+import json
+import threading
+import time
+
+from apimodel import APIField, DeadlineExceeded, NotFound, Paginator, \
+    ResponseCache, deadline, deadlines
+from apimodel.aio import AsyncAPICollection, AsyncAPICollectionField, \
+    AsyncAPIModel, AsyncAPIModelField, AsyncResponse, AsyncTransport, \
+    _AsyncSingleFlight
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+SERVER_BASKET_URL = 'http://example.com/v1/baskets/{0}/'
+SERVER_EGG_URL = 'http://example.com/v1/eggs/{0}/'
+SERVER_EGG_COLLECTION_URL = 'http://example.com/v1/eggs/'
+SERVER_EGG_PAGE_URL = 'http://example.com/v1/eggs/?page={0}'
+PAGES = {
+    SERVER_BASKET_URL.format('myid'): {
+        'basket_id': 'myid',
+        'egg': SERVER_EGG_URL.format('organic'),
+        'eggs': [
+            SERVER_EGG_URL.format('organic'),
+            SERVER_EGG_URL.format('regular'),
+        ],
+        'candies': [{'candy_id': 'mycandy'}],
+    },
+    SERVER_EGG_URL.format('organic'): {'egg_id': 'organic'},
+    SERVER_EGG_URL.format('regular'): {'egg_id': 'regular'},
+    SERVER_EGG_COLLECTION_URL: [{'egg_id': 'organic'}],
+    SERVER_EGG_PAGE_URL.format(1): {'results': [{'egg_id': 'organic'}],
+                                    'next': '/v1/eggs/?page=2'},
+    SERVER_EGG_PAGE_URL.format(2): {'results': [{'egg_id': 'regular'}],
+                                    'next': None},
+    SERVER_BASKET_URL.format('envelope'): {'data': {'eggs': [
+        {'egg_id': 'organic'}]}},
+}
+
+
+class DictTransport(AsyncTransport):
+    def __init__(self, pages):
+        super().__init__()
+        self.pages = pages
+        self.urls = []
+
+    async def get(self, url, headers=None):
+        self.urls.append(url)
+        await asyncio.sleep(0)
+        if url not in self.pages:
+            return AsyncResponse(404, {}, b'')
+        return AsyncResponse(200, {}, json.dumps(self.pages[url]).encode())
+
+
+class Candy(AsyncAPIModel):
+    fields = {
+        'candy_id': APIField(str),
+    }
+
+
+class Egg(AsyncAPIModel):
+    async_transport = DictTransport(PAGES)
+
+    fields = {
+        'egg_id': APIField(str),
+    }
+
+    finders = {
+        'egg_id': SERVER_EGG_URL,
+    }
+
+
+class Basket(AsyncAPIModel):
+    async_transport = Egg.async_transport
+
+    finders = {
+        'basket_id': SERVER_BASKET_URL,
+    }
+
+    fields = {
+        'basket_id': APIField(str),
+        'egg': AsyncAPIModelField(model=Egg),
+        'eggs': AsyncAPICollectionField(model='Egg'),
+        'candies': AsyncAPICollectionField(model=Candy),
+        'all_eggs': AsyncAPICollectionField(model=Egg,
+                                            url=SERVER_EGG_COLLECTION_URL),
+    }
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class DescribeAsyncAPIModel(TestCase):
+    def setUp(self):
+        Egg.async_transport.urls = []
+
+    def test_construction_does_not_fetch(self):
+        Basket(basket_id='myid')
+        self.assertEqual(Egg.async_transport.urls, [])
+
+    def test_aget_loads_scalar_fields(self):
+        basket = Basket(basket_id='myid')
+        self.assertEqual(run(basket.aget('basket_id')), 'myid')
+        self.assertEqual(basket.basket_id, 'myid')
+
+    def test_aget_loads_related_model(self):
+        async def load():
+            basket = await Basket.get(basket_id='myid')
+            return await (await basket.aget('egg')).aget('egg_id')
+
+        self.assertEqual(run(load()), 'organic')
+
+    def test_unloaded_fields_need_aget(self):
+        self.assertRaises(AttributeError, getattr, Basket({}), 'basket_id')
+
+    def test_unknown_fields_raise(self):
+        self.assertRaises(AttributeError, run, Basket({}).aget('jawn'))
+
+    def test_missing_resource_raises_not_found(self):
+        self.assertRaises(NotFound, run, Egg.get(egg_id='rotten'))
+
+    def test_concurrent_lookups_share_one_request(self):
+        async def load():
+            return await asyncio.gather(
+                *[Egg.get(egg_id='organic') for _ in range(5)])
+
+        self.assertEqual(len(run(load())), 5)
+        self.assertEqual(Egg.async_transport.urls,
+                         [SERVER_EGG_URL.format('organic')])
+
+
+class BudgetTransport(DictTransport):
+    def __init__(self, pages):
+        super().__init__(pages)
+        self.budgets = []
+
+    async def get(self, url, headers=None):
+        self.budgets.append(deadlines.remaining())
+        return await super().get(url, headers)
+
+
+class StaleEgg(Egg):
+    async_transport = BudgetTransport(PAGES)
+    cache = ResponseCache()
+    cache_ttl = 60
+    stale_ttl = 300
+
+
+class DescribeAsyncStaleWhileRevalidate(TestCase):
+    def test_background_refresh_outlives_callers_deadline(self):
+        url = SERVER_EGG_URL.format('organic')
+
+        async def load():
+            await StaleEgg.get(egg_id='organic')
+            StaleEgg.cache.get(url, count=False).expires = \
+                time.monotonic() - 1
+            with deadline(5):
+                await StaleEgg.get(egg_id='organic')
+            await asyncio.sleep(0.01)
+
+        run(load())
+        self.assertEqual(StaleEgg.async_transport.budgets, [None, None])
+        self.assertTrue(StaleEgg.cache.get(url).is_fresh())
+
+
+class DescribeAsyncRefreshLimit(TestCase):
+    def test_counts_only_background_refreshes(self):
+        inflight = _AsyncSingleFlight()
+
+        async def wait(event):
+            await event.wait()
+
+        async def load():
+            event = asyncio.Event()
+            loads = [asyncio.ensure_future(inflight.do(i, wait, event))
+                     for i in range(5)]
+            await asyncio.sleep(0)
+            started = [inflight.start(key, wait, event, limit=2)
+                       for key in ('a', 'b', 'c')]
+            event.set()
+            await asyncio.gather(*loads)
+            return started
+
+        self.assertEqual(run(load()), [True, True, False])
+
+
+
+class DescribeAsyncCoalescedDeadlines(TestCase):
+    def setUp(self):
+        self.inflight = _AsyncSingleFlight()
+        self.calls = 0
+
+    async def slow(self, event):
+        self.calls += 1
+        with deadline(0.01 if self.calls == 1 else 5):
+            await event.wait()
+            if deadlines.remaining() <= 0:
+                raise DeadlineExceeded('too slow')
+        return self.calls
+
+    def test_waiting_lookup_keeps_its_own_deadline(self):
+        async def load():
+            event = asyncio.Event()
+            leader = asyncio.ensure_future(
+                self.inflight.do('key', self.slow, event))
+            await asyncio.sleep(0)
+            with self.assertRaises(DeadlineExceeded):
+                with deadline(0.01):
+                    await self.inflight.do('key', self.slow, event)
+            event.set()
+            return await asyncio.gather(leader, return_exceptions=True)
+
+        run(load())
+        self.assertEqual(self.calls, 1)
+
+    def test_waiting_lookup_outlives_shorter_deadline(self):
+        async def load():
+            event = asyncio.Event()
+            leader = asyncio.ensure_future(
+                self.inflight.do('key', self.slow, event))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(
+                self.inflight.do('key', self.slow, event))
+            await asyncio.sleep(0.05)
+            event.set()
+            return await asyncio.gather(leader, follower,
+                                        return_exceptions=True)
+
+        leader, follower = run(load())
+        self.assertIsInstance(leader, DeadlineExceeded)
+        self.assertEqual(follower, 2)
+
+
+class DescribeAsyncAPICollection(TestCase):
+    def setUp(self):
+        self.basket = run(Basket.get(basket_id='myid'))
+
+    def test_all_loads_models(self):
+        async def load():
+            eggs = await self.basket.aget('eggs')
+            return [await egg.aget('egg_id') for egg in await eggs.all()]
+
+        self.assertEqual(run(load()), ['organic', 'regular'])
+
+    def test_async_iteration(self):
+        async def load():
+            eggs = await self.basket.aget('eggs')
+            return [await egg.aget('egg_id') async for egg in eggs]
+
+        self.assertEqual(run(load()), ['organic', 'regular'])
+
+    def test_first_and_count(self):
+        async def load():
+            candies = await self.basket.aget('candies')
+            first = await candies.first()
+            return await first.aget('candy_id'), await candies.count()
+
+        self.assertEqual(run(load()), ('mycandy', 1))
+
+    def test_collection_from_url(self):
+        async def load():
+            eggs = await self.basket.aget('all_eggs')
+            return await eggs.count()
+
+        self.assertEqual(run(load()), 1)
+
+    def test_reads_every_page(self):
+        eggs = AsyncAPICollection(model=Egg,
+                                  data=SERVER_EGG_PAGE_URL.format(1))
+        eggs.paginator = Paginator()
+
+        async def load():
+            return await eggs.count(), [
+                await egg.aget('egg_id') for egg in await eggs.all()]
+
+        self.assertEqual(run(load()), (2, ['organic', 'regular']))
+
+    def test_reads_streamed_collections_whole(self):
+        eggs = AsyncAPICollection(model=Egg,
+                                  data=SERVER_BASKET_URL.format('envelope'))
+        eggs.stream = True
+        eggs.stream_path = 'data.eggs'
+        self.assertEqual(run(eggs.count()), 1)
+
+    def test_standalone_collection(self):
+        eggs = AsyncAPICollection(model=Egg, data=[{'egg_id': 'organic'}])
+        self.assertEqual(len(run(eggs.all())), 1)
+
+
+class EggHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps({'egg_id': self.path.strip('/')}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@skipIf(aiohttp is None, 'aiohttp is not installed')
+class DescribeAsyncTransport(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), EggHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_fetches_over_http(self):
+        transport = AsyncTransport(limit=2)
+
+        class LocalEgg(AsyncAPIModel):
+            async_transport = transport
+            fields = {'egg_id': APIField(str)}
+            finders = {'egg_id': 'http://127.0.0.1:{0}/{{0}}'.format(
+                self.server.server_port)}
+
+        async def load():
+            try:
+                eggs = await asyncio.gather(
+                    *[LocalEgg.get(egg_id=str(i)) for i in range(5)])
+                return [await egg.aget('egg_id') for egg in eggs]
+            finally:
+                await transport.close()
+
+        self.assertEqual(run(load()), ['0', '1', '2', '3', '4'])
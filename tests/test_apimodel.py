@@ -5,7 +5,7 @@ import json
 import responses
 
 from apimodel import APICollection, APIModel, NotFound, \
-    APIField, APIModelField, APICollectionField
+    APIField, APIModelField, APICollectionField, FieldDescriptor, Session
 
 SERVER_BASKET_URL = 'http://example.com/v1/baskets/{0}/'
 # TODO: responses does not support mocking querystring requests
@@ -482,3 +482,233 @@ class DescribeNonEmptyAPICollectionField(BaseTestAPICollectionField):
 
     def test_should_have_count(self):
         self.assertEqual(self.result.count(), 2)
+
+
+class DescribePrefetch(TestCase):
+    def add_responses(self):
+        responses.add(responses.GET, SERVER_BASKET_SEARCH_URL.format('myid'),
+                      body=json.dumps([BASKET1_DATA, BASKET2_DATA]),
+                      content_type='application/json')
+        responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                      body=SERVER_EGG_JSON_1, content_type='application/json')
+        responses.add(responses.GET, SERVER_EGG_URL.format('regular'),
+                      body=SERVER_EGG_JSON_2, content_type='application/json')
+
+    @responses.activate
+    def test_fetches_each_related_url_once(self):
+        self.add_responses()
+        collection = BasketCollection(basket_id='myid')
+        collection.prefetch('egg', 'eggs__egg_id', 'candies')
+        self.assertEqual(len(responses.calls), 3)
+        for basket in collection.all():
+            self.assertEqual(basket.egg.egg_id, 'organic')
+            self.assertEqual([egg.egg_id for egg in basket.eggs.all()],
+                             ['organic', 'regular'])
+            self.assertEqual(basket.candies.first().candy_id, 'mycandy')
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_shares_instances_for_the_same_url(self):
+        self.add_responses()
+        first, second = BasketCollection(basket_id='myid').prefetch(
+            'egg').all()
+        self.assertIs(first.egg, second.egg)
+
+    @responses.activate
+    def test_fetches_collection_urls(self):
+        responses.add(responses.GET, SERVER_BASKET_SEARCH_URL.format('myid'),
+                      body=json.dumps([BASKET1_DATA, BASKET2_DATA]),
+                      content_type='application/json')
+        for basket_id in ('myid', 'myid2'):
+            responses.add(
+                responses.GET,
+                '{}basket_id={}'.format(SERVER_EGG_COLLECTION_URL, basket_id),
+                body=SERVER_EGG_COLLECTION, content_type='application/json')
+        collection = BasketCollection(model=BetterBasket, basket_id='myid')
+        collection.prefetch('eggs')
+        self.assertEqual(len(responses.calls), 3)
+        self.assertEqual(
+            [basket.eggs.count() for basket in collection.all()], [2, 2])
+        self.assertEqual(len(responses.calls), 3)
+
+    def test_rejects_unknown_fields(self):
+        collection = APICollection(model=Basket, data=[BASKET1_DATA])
+        self.assertRaises(ValueError, collection.prefetch, 'jawn')
+
+
+class DescribeSession(TestCase):
+    def add_responses(self):
+        responses.add(responses.GET, SERVER_BASKET_URL.format('myid'),
+                      body=SERVER_BASKET_JSON, content_type='application/json')
+        responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                      body=SERVER_EGG_JSON_1, content_type='application/json')
+        responses.add(responses.GET, SERVER_EGG_URL.format('regular'),
+                      body=SERVER_EGG_JSON_2, content_type='application/json')
+
+    @responses.activate
+    def test_returns_one_instance_per_url(self):
+        self.add_responses()
+        with Session():
+            basket = Basket(basket_id='myid')
+            self.assertIs(Basket(basket_id='myid'), basket)
+            self.assertIs(Basket(SERVER_BASKET_URL.format('myid')), basket)
+            self.assertIs(basket.egg, basket.eggs.all()[0])
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_instances_are_not_shared_outside_session(self):
+        self.add_responses()
+        with Session():
+            basket = Basket(basket_id='myid')
+        self.assertIsNot(Basket(basket_id='myid'), basket)
+
+    def test_models_built_from_data_are_not_shared(self):
+        with Session() as session:
+            self.assertIsNot(Candy({'candy_id': 'a'}),
+                             Candy({'candy_id': 'a'}))
+        self.assertEqual(len(session), 0)
+
+    @responses.activate
+    def test_failed_lookups_are_not_recorded(self):
+        responses.add(responses.GET, SERVER_BASKET_URL.format('123'),
+                      status=404, content_type='application/json')
+        with Session() as session:
+            self.assertRaises(NotFound, Basket, basket_id='123')
+        self.assertEqual(len(session), 0)
+
+    @responses.activate
+    def test_loads_instances_first_built_lazily(self):
+        self.add_responses()
+        responses.add(responses.GET, SERVER_BASKET_URL.format('123'),
+                      status=404, content_type='application/json')
+        with Session():
+            lazy = Basket(basket_id='myid', lazy_load=True)
+            Basket(basket_id='123', lazy_load=True)
+            self.assertIs(Basket(basket_id='myid'), lazy)
+            self.assertEqual(len(responses.calls), 1)
+            self.assertRaises(NotFound, Basket, basket_id='123')
+
+
+class DescribeStreamingCollection(TestCase):
+    def setUp(self):
+        self.urls = [SERVER_EGG_URL.format('organic'),
+                     SERVER_EGG_URL.format('regular')] * 10
+
+    def add_responses(self):
+        responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                      body=SERVER_EGG_JSON_1, content_type='application/json')
+        responses.add(responses.GET, SERVER_EGG_URL.format('regular'),
+                      body=SERVER_EGG_JSON_2, content_type='application/json')
+
+    @responses.activate
+    def test_iteration_yields_models_in_order(self):
+        self.add_responses()
+        collection = APICollection(model=Egg, data=self.urls)
+        collection.read_ahead = 3
+        self.assertEqual([egg.egg_id for egg in collection],
+                         ['organic', 'regular'] * 10)
+        self.assertFalse(hasattr(collection, '_models'))
+
+    @responses.activate
+    def test_slicing_builds_only_requested_models(self):
+        self.add_responses()
+        collection = APICollection(model=Egg, data=self.urls)
+        eggs = collection[2:4]
+        self.assertEqual([egg.egg_id for egg in eggs], ['organic', 'regular'])
+        self.assertEqual(len(responses.calls), 2)
+        self.assertIs(collection[3], eggs[1])
+        self.assertEqual(collection[-1].egg_id, 'regular')
+        self.assertEqual(len(responses.calls), 3)
+
+    def test_first_builds_only_one_model(self):
+        collection = APICollection(model=Egg, data=self.urls)
+        self.assertIsInstance(collection.first(), Egg)
+        self.assertEqual(len(collection._built), 1)
+
+    def test_index_out_of_range(self):
+        collection = APICollection(model=Candy, data=[{'candy_id': 'a'}])
+        self.assertRaises(IndexError, lambda: collection[1])
+
+    def test_iterates_loaded_models(self):
+        collection = APICollection(model=Candy, data=[{'candy_id': 'a'}])
+        models = collection.all()
+        self.assertEqual(list(collection), models)
+        self.assertEqual(collection.count(), 1)
+
+    @responses.activate
+    def test_truth_test_does_not_load(self):
+        collection = APICollection(model=Egg, data=self.urls)
+        self.assertTrue(collection)
+        self.assertEqual(len(responses.calls), 0)
+
+
+class CompactEgg(APIModel):
+    compact = True
+
+    fields = {
+        'egg_id': APIField(str),
+        'basket_id': APIField(str),
+    }
+
+
+class CompactBasket(APIModel):
+    compact = True
+
+    fields = {
+        'basket_id': APIField(str),
+        'egg': APIModelField(model=CompactEgg),
+    }
+
+
+class DescribeCompiledFields(TestCase):
+    def test_fields_are_descriptors(self):
+        self.assertIsInstance(Basket.__dict__['basket_id'], FieldDescriptor)
+
+    def test_loaded_fields_are_instance_attributes(self):
+        basket = Basket(dict(basket_id='myid'))
+        self.assertEqual(basket.basket_id, 'myid')
+        self.assertEqual(basket.__dict__['basket_id'], 'myid')
+
+    def test_fields_can_not_shadow_class_attributes(self):
+        class Page(APIModel):
+            fields = {'url': APIField(str)}
+
+        self.assertIsNone(Page.url)
+
+
+class DescribeCompactModel(TestCase):
+    def test_has_no_instance_dict(self):
+        self.assertFalse(hasattr(CompactEgg({'egg_id': 'organic'}),
+                                 '__dict__'))
+
+    def test_loads_fields_into_slots(self):
+        egg = CompactEgg({'egg_id': 'organic'})
+        self.assertEqual(egg._loaded_field('egg_id'), (False, None))
+        self.assertEqual(egg.egg_id, 'organic')
+        self.assertEqual(egg._loaded_field('egg_id'), (True, 'organic'))
+        self.assertIsNone(egg.basket_id)
+
+    def test_rejects_undeclared_attributes(self):
+        egg = CompactEgg({'egg_id': 'organic'})
+        self.assertRaises(AttributeError, setattr, egg, 'jawn', 1)
+        self.assertRaises(AttributeError, getattr, egg, 'jawn')
+
+    def test_subclasses_stay_compact(self):
+        class BigEgg(CompactEgg):
+            fields = dict(CompactEgg.fields, size=APIField(int))
+
+        egg = BigEgg({'egg_id': 'organic', 'size': '3'})
+        self.assertFalse(hasattr(egg, '__dict__'))
+        self.assertEqual((egg.egg_id, egg.size), ('organic', 3))
+
+    @responses.activate
+    def test_prefetches_into_slots(self):
+        responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                      body=SERVER_EGG_JSON_1, content_type='application/json')
+        collection = APICollection(model=CompactBasket, data=[
+            {'basket_id': 'a', 'egg': SERVER_EGG_URL.format('organic')},
+            {'basket_id': 'b', 'egg': SERVER_EGG_URL.format('organic')},
+        ])
+        baskets = collection.prefetch('egg').all()
+        self.assertIs(baskets[0].egg, baskets[1].egg)
+        self.assertEqual(len(responses.calls), 1)
@@ -0,0 +1,123 @@
+from unittest import TestCase
+import json
+
+import requests
+import responses
+
+from apimodel import APIModel, APIField, BulkResult, NotFound
+
+SERVER_EGG_URL = 'http://example.com/v1/eggs/{0}/'
+SERVER_EGG_BATCH_URL = 'http://example.com/v1/eggs/?ids={0}'
+
+
+class Egg(APIModel):
+    fields = {
+        'egg_id': APIField(str),
+    }
+
+    finders = {
+        'egg_id': SERVER_EGG_URL,
+    }
+
+
+class BatchEgg(Egg):
+    batch_finders = {
+        'egg_id': SERVER_EGG_BATCH_URL,
+    }
+    batch_size = 2
+
+
+def add_egg(egg_id, status=200):
+    responses.add(responses.GET, SERVER_EGG_URL.format(egg_id),
+                  body=json.dumps({'egg_id': egg_id}), status=status,
+                  content_type='application/json')
+
+
+def add_batch(ids, found):
+    responses.add(responses.GET, SERVER_EGG_BATCH_URL.format(','.join(ids)),
+                  body=json.dumps([{'egg_id': egg_id} for egg_id in found]),
+                  content_type='application/json')
+
+
+class DescribeGetMany(TestCase):
+    @responses.activate
+    def test_returns_models_in_order(self):
+        for egg_id in ('a', 'b', 'c'):
+            add_egg(egg_id)
+        eggs = Egg.get_many(egg_id=['c', 'a', 'b'])
+        self.assertIsInstance(eggs, BulkResult)
+        self.assertEqual([egg.egg_id for egg in eggs], ['c', 'a', 'b'])
+        self.assertEqual(eggs.errors, {})
+
+    @responses.activate
+    def test_reports_missing_keys_per_item(self):
+        add_egg('a')
+        add_egg('missing', status=404)
+        eggs = Egg.get_many(egg_id=['missing', 'a'])
+        self.assertIsNone(eggs[0])
+        self.assertEqual(eggs[1].egg_id, 'a')
+        self.assertIsInstance(eggs.errors['missing'], NotFound)
+
+    @responses.activate
+    def test_fetches_repeated_keys_once(self):
+        add_egg('a')
+        eggs = Egg.get_many(egg_id=['a', 'a'])
+        self.assertEqual(len(eggs), 2)
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_reports_connection_errors_per_item(self):
+        add_egg('a')
+        responses.add(responses.GET, SERVER_EGG_URL.format('down'),
+                      body=requests.ConnectionError('refused'))
+        eggs = Egg.get_many(egg_id=['a', 'down'])
+        self.assertEqual(eggs[0].egg_id, 'a')
+        self.assertIsInstance(eggs.errors['down'], requests.ConnectionError)
+
+    def test_requires_one_key(self):
+        self.assertRaises(ValueError, Egg.get_many, egg_id=[], basket_id=[])
+
+
+class DescribeBatchFinders(TestCase):
+    @responses.activate
+    def test_chunks_keys_into_batch_requests(self):
+        add_batch(['a', 'b'], ['b', 'a'])
+        add_batch(['c'], ['c'])
+        eggs = BatchEgg.get_many(egg_id=['a', 'b', 'c'])
+        self.assertEqual([egg.egg_id for egg in eggs], ['a', 'b', 'c'])
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_reports_keys_missing_from_batch(self):
+        add_batch(['a', 'missing'], ['a'])
+        eggs = BatchEgg.get_many(egg_id=['a', 'missing'])
+        self.assertEqual(eggs[0].egg_id, 'a')
+        self.assertIsNone(eggs[1])
+        self.assertIsInstance(eggs.errors['missing'], NotFound)
+
+    @responses.activate
+    def test_reports_keys_returned_as_urls_as_missing(self):
+        responses.add(responses.GET, SERVER_EGG_BATCH_URL.format('a,b'),
+                      body=json.dumps([{'egg_id': 'a'},
+                                       SERVER_EGG_URL.format('b')]),
+                      content_type='application/json')
+        eggs = BatchEgg.get_many(egg_id=['a', 'b'])
+        self.assertEqual(eggs[0].egg_id, 'a')
+        self.assertIsNone(eggs[1])
+        self.assertIsInstance(eggs.errors['b'], NotFound)
+
+    @responses.activate
+    def test_reports_failed_batches_for_each_key(self):
+        responses.add(responses.GET, SERVER_EGG_BATCH_URL.format('a,b'),
+                      status=500)
+        eggs = BatchEgg.get_many(egg_id=['a', 'b'])
+        self.assertEqual(list(eggs), [None, None])
+        self.assertEqual(set(eggs.errors), {'a', 'b'})
+
+    @responses.activate
+    def test_reports_batch_connection_errors_for_each_key(self):
+        responses.add(responses.GET, SERVER_EGG_BATCH_URL.format('a,b'),
+                      body=requests.Timeout('timed out'))
+        eggs = BatchEgg.get_many(egg_id=['a', 'b'])
+        self.assertEqual(list(eggs), [None, None])
+        self.assertIsInstance(eggs.errors['a'], requests.Timeout)
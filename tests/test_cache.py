@@ -0,0 +1,424 @@
+from unittest import TestCase
+from unittest.mock import patch
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+import responses
+
+from apimodel import APIModel, APIField, APICollectionField, DiskCache, \
+    NotFound, ResponseCache, deadline
+from apimodel import deadlines
+from apimodel.concurrency import SharedExecutor
+
+SERVER_EGG_URL = 'http://example.com/v1/eggs/{0}/'
+SERVER_EGG_JSON = json.dumps({'egg_id': 'organic'})
+
+
+class Egg(APIModel):
+    cache = ResponseCache()
+    cache_ttl = 60
+
+    fields = {
+        'egg_id': APIField(str),
+    }
+
+    finders = {
+        'egg_id': SERVER_EGG_URL,
+    }
+
+
+class UncachedEgg(Egg):
+    cache_ttl = None
+
+
+class Basket(APIModel):
+    fields = {
+        'eggs': APICollectionField(model=Egg),
+    }
+
+
+class DescribeResponseCache(TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(maxsize=2)
+
+    def test_returns_stored_data(self):
+        self.cache.set('a', {'id': 1}, ttl=10)
+        self.assertEqual(self.cache.get('a').data, {'id': 1})
+
+    def test_counts_hits_and_misses(self):
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        self.cache.get('b')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_expires_entries(self):
+        with patch('apimodel.cache.time.monotonic', return_value=100):
+            self.cache.set('a', 1, ttl=5)
+        with patch('apimodel.cache.time.monotonic', return_value=106):
+            self.assertIsNone(self.cache.get('a'))
+
+    def test_invalidates_entries(self):
+        self.cache.set('a', 1)
+        self.assertTrue(self.cache.invalidate('a'))
+        self.assertFalse(self.cache.invalidate('a'))
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_returns_stale_entries_on_request(self):
+        with patch('apimodel.cache.time.monotonic', return_value=100):
+            self.cache.set('a', 1, ttl=5)
+        with patch('apimodel.cache.time.monotonic', return_value=106):
+            self.assertFalse(self.cache.get('a', allow_stale=True).is_fresh())
+            self.assertTrue(self.cache.touch('a', ttl=5))
+            self.assertTrue(self.cache.get('a').is_fresh())
+
+
+class DescribeModelCaching(TestCase):
+    def setUp(self):
+        Egg.cache.clear()
+
+    @responses.activate
+    def test_repeated_lookups_hit_cache(self):
+        responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                      body=SERVER_EGG_JSON, content_type='application/json')
+        Egg(egg_id='organic')
+        self.assertEqual(Egg(egg_id='organic').egg_id, 'organic')
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(Egg.cache.stats()['hits'], 1)
+
+    @responses.activate
+    def test_models_without_ttl_are_not_cached(self):
+        responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                      body=SERVER_EGG_JSON, content_type='application/json')
+        UncachedEgg(egg_id='organic')
+        UncachedEgg(egg_id='organic')
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_invalidate_by_finder_key(self):
+        responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                      body=SERVER_EGG_JSON, content_type='application/json')
+        Egg(egg_id='organic')
+        self.assertTrue(Egg.invalidate(egg_id='organic'))
+        Egg(egg_id='organic')
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_collection_elements_share_cache(self):
+        responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                      body=SERVER_EGG_JSON, content_type='application/json')
+        url = SERVER_EGG_URL.format('organic')
+        basket = Basket({'eggs': [url, url]})
+        self.assertEqual([egg.egg_id for egg in basket.eggs.all()],
+                         ['organic', 'organic'])
+        self.assertEqual(Egg(url).egg_id, 'organic')
+        self.assertLessEqual(len(responses.calls), 2)
+
+
+def write_entry(path):
+    DiskCache(path).set('from-child', None, ttl=60,
+                        content=b'{"egg_id": "child"}')
+
+
+class DescribeDiskCache(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite')
+        self.cache = DiskCache(self.path, maxsize=3)
+
+    def test_stores_raw_content_and_headers(self):
+        self.cache.set('a', None, ttl=10, headers={'ETag': '"1"'},
+                       content=b'{"egg_id": "organic"}')
+        entry = self.cache.get('a')
+        self.assertEqual(entry.content, b'{"egg_id": "organic"}')
+        self.assertEqual(entry.headers['etag'], '"1"')
+
+    def test_serializes_data_without_content(self):
+        self.cache.set('a', {'egg_id': 'organic'})
+        self.assertEqual(json.loads(self.cache.get('a').content),
+                         {'egg_id': 'organic'})
+
+    def test_counts_hits_and_misses(self):
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        self.cache.get('b')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_expires_entries(self):
+        with patch('apimodel.cache.time.time', return_value=100):
+            self.cache.set('a', 1, ttl=5)
+        with patch('apimodel.cache.time.time', return_value=106):
+            self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_evicts_least_recently_used(self):
+        for now, key in enumerate('abc'):
+            with patch('apimodel.cache.time.time', return_value=now):
+                self.cache.set(key, 1)
+        with patch('apimodel.cache.time.time', return_value=10):
+            self.cache.get('a')
+            self.cache.set('d', 1)
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertEqual(len(self.cache), 3)
+
+    def test_evicts_to_byte_limit(self):
+        cache = DiskCache(self.path, max_bytes=250, compress=False)
+        for key in 'abc':
+            cache.set(key, None, content=b'x' * 100)
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.stats()['bytes'], 250)
+
+    def test_invalidates_entries(self):
+        self.cache.set('a', 1)
+        self.assertTrue(self.cache.invalidate('a'))
+        self.assertFalse(self.cache.invalidate('a'))
+
+    def test_records_access_at_most_once_per_interval(self):
+        def accessed():
+            return self.cache._connect().execute(
+                'SELECT accessed FROM entries').fetchone()[0]
+
+        with patch('apimodel.cache.time.time', return_value=100):
+            self.cache.set('a', 1)
+        with patch('apimodel.cache.time.time', return_value=100.5):
+            self.cache.get('a')
+        self.assertEqual(accessed(), 100)
+        with patch('apimodel.cache.time.time', return_value=102):
+            self.cache.get('a')
+        self.assertEqual(accessed(), 102)
+
+    def test_keeps_totals_as_entries_change(self):
+        cache = DiskCache(self.path, compress=False)
+        cache.set('a', None, content=b'x' * 10)
+        cache.set('b', None, content=b'x' * 20)
+        cache.set('a', None, content=b'x' * 5)
+        cache.invalidate('b')
+        self.assertEqual((len(cache), cache.stats()['bytes']), (1, 5))
+
+    def test_counts_entries_of_existing_files(self):
+        cache = DiskCache(self.path, compress=False)
+        cache.set('a', None, content=b'x' * 10)
+        connection = cache._connect()
+        connection.execute('DROP TABLE totals')
+        self.assertEqual(DiskCache(self.path).stats()['bytes'], 10)
+
+    def test_is_shared_across_processes(self):
+        process = multiprocessing.Process(target=write_entry,
+                                          args=(self.path,))
+        process.start()
+        process.join()
+        self.assertEqual(json.loads(self.cache.get('from-child').content),
+                         {'egg_id': 'child'})
+
+    @responses.activate
+    def test_serves_models_after_restart(self):
+        responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                      body=SERVER_EGG_JSON, content_type='application/json')
+
+        class DiskEgg(Egg):
+            cache = DiskCache(self.path)
+
+        DiskEgg(egg_id='organic')
+        DiskEgg.cache = DiskCache(self.path)
+        self.assertEqual(DiskEgg(egg_id='organic').egg_id, 'organic')
+        self.assertEqual(len(responses.calls), 1)
+
+
+class DescribeConditionalRevalidation(TestCase):
+    def setUp(self):
+        Egg.cache.clear()
+        self.url = SERVER_EGG_URL.format('organic')
+
+    def expire(self):
+        Egg.cache.get(self.url, count=False).expires = 0
+
+    @responses.activate
+    def test_sends_validators_and_reuses_data_on_not_modified(self):
+        responses.add(responses.GET, self.url, body=SERVER_EGG_JSON,
+                      headers={'ETag': '"v1"',
+                               'Last-Modified': 'Mon, 02 Mar 2026 10:00:00 '
+                                                'GMT'},
+                      content_type='application/json')
+        responses.add(responses.GET, self.url, status=304)
+        first = Egg(egg_id='organic')
+        self.expire()
+        second = Egg(egg_id='organic')
+        request = responses.calls[1].request
+        self.assertEqual(request.headers['If-None-Match'], '"v1"')
+        self.assertIn('If-Modified-Since', request.headers)
+        self.assertIs(second._data, first._data)
+        self.assertTrue(Egg.cache.get(self.url).is_fresh())
+        self.assertEqual(Egg.cache.stats()['revalidations'], 1)
+
+    @responses.activate
+    def test_refetches_changed_resources(self):
+        responses.add(responses.GET, self.url, body=SERVER_EGG_JSON,
+                      headers={'ETag': '"v1"'},
+                      content_type='application/json')
+        responses.add(responses.GET, self.url,
+                      body=json.dumps({'egg_id': 'free-range'}),
+                      headers={'ETag': '"v2"'},
+                      content_type='application/json')
+        Egg(egg_id='organic')
+        self.expire()
+        self.assertEqual(Egg(egg_id='organic').egg_id, 'free-range')
+        self.assertEqual(Egg.cache.get(self.url).headers['ETag'], '"v2"')
+
+    @responses.activate
+    def test_skips_decoding_identical_bodies(self):
+        decoded = []
+
+        def decode(content):
+            decoded.append(content)
+            return json.loads(content)
+
+        class CountingEgg(Egg):
+            cache = ResponseCache()
+            decoder = decode
+
+        responses.add(responses.GET, self.url, body=SERVER_EGG_JSON,
+                      content_type='application/json')
+        responses.add(responses.GET, self.url, body=SERVER_EGG_JSON,
+                      content_type='application/json')
+        first = CountingEgg(egg_id='organic')
+        CountingEgg.cache.get(self.url, count=False).expires = 0
+        second = CountingEgg(egg_id='organic')
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(len(decoded), 1)
+        self.assertIs(second._data, first._data)
+
+    @responses.activate
+    def test_not_modified_without_cached_entry_is_not_found(self):
+        responses.add(responses.GET, self.url, status=304)
+        with self.assertRaises(NotFound):
+            Egg(egg_id='organic')
+
+    @responses.activate
+    def test_revalidates_disk_entries(self):
+        responses.add(responses.GET, self.url, body=SERVER_EGG_JSON,
+                      headers={'ETag': '"v1"'},
+                      content_type='application/json')
+        responses.add(responses.GET, self.url, status=304)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        class DiskEgg(Egg):
+            cache = DiskCache(os.path.join(directory.name, 'cache.sqlite'))
+
+        with patch('apimodel.cache.time.time', return_value=100):
+            DiskEgg(egg_id='organic')
+        self.assertEqual(DiskEgg(egg_id='organic').egg_id, 'organic')
+        self.assertEqual(responses.calls[1].request.headers['If-None-Match'],
+                         '"v1"')
+        self.assertTrue(DiskEgg.cache.get(self.url).is_fresh())
+        self.assertEqual(DiskEgg.cache.stats()['revalidations'], 1)
+
+
+class StaleEgg(Egg):
+    cache = ResponseCache()
+    stale_ttl = 300
+    executor = SharedExecutor(max_workers=1)
+
+    fields = {
+        'egg_id': APIField(str),
+        'color': APIField(str),
+    }
+
+
+class DescribeStaleWhileRevalidate(TestCase):
+    def setUp(self):
+        StaleEgg.cache.clear()
+        self.url = SERVER_EGG_URL.format('organic')
+
+    def tearDown(self):
+        self.wait_for_refresh()
+
+    def add_responses(self, *colors):
+        for color in colors:
+            responses.add(responses.GET, self.url,
+                          body=json.dumps({'egg_id': 'organic',
+                                           'color': color}),
+                          content_type='application/json')
+
+    def expire(self, by=1):
+        entry = StaleEgg.cache.get(self.url, count=False)
+        entry.expires = time.monotonic() - by
+
+    def wait_for_refresh(self):
+        StaleEgg.executor.shutdown(wait=True)
+
+    @responses.activate
+    def test_serves_stale_data_and_refreshes_in_background(self):
+        self.add_responses('brown', 'white')
+        StaleEgg(egg_id='organic')
+        self.expire()
+        self.assertEqual(StaleEgg(egg_id='organic').color, 'brown')
+        self.wait_for_refresh()
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(StaleEgg(egg_id='organic').color, 'white')
+
+    @responses.activate
+    def test_background_refresh_outlives_callers_deadline(self):
+        def slow(request):
+            # responses ignores timeouts, so check the refresh's budget.
+            if deadlines.remaining() is not None:
+                return 504, {}, ''
+            time.sleep(0.2)
+            return 200, {}, json.dumps({'egg_id': 'organic',
+                                        'color': 'white'})
+
+        self.add_responses('brown')
+        responses.add_callback(responses.GET, self.url, callback=slow)
+        StaleEgg(egg_id='organic')
+        self.expire()
+        with deadline(0.1):
+            self.assertEqual(StaleEgg(egg_id='organic').color, 'brown')
+        self.wait_for_refresh()
+        entry = StaleEgg.cache.get(self.url)
+        self.assertTrue(entry.is_fresh())
+        self.assertEqual(entry.data['color'], 'white')
+
+    @responses.activate
+    def test_fetches_in_foreground_after_stale_window(self):
+        self.add_responses('brown', 'white')
+        StaleEgg(egg_id='organic')
+        self.expire(by=301)
+        self.assertEqual(StaleEgg(egg_id='organic').color, 'white')
+
+    @responses.activate
+    def test_failed_refresh_keeps_stale_entry(self):
+        self.add_responses('brown')
+        responses.add(responses.GET, self.url, status=500)
+        StaleEgg(egg_id='organic')
+        self.expire()
+        StaleEgg(egg_id='organic')
+        self.wait_for_refresh()
+        entry = StaleEgg.cache.get(self.url, allow_stale=True)
+        self.assertEqual(entry.data['color'], 'brown')
+
+    @responses.activate
+    def test_refresh_reloads_only_changed_fields(self):
+        self.add_responses('brown', 'white')
+        egg = StaleEgg(egg_id='organic')
+        egg_id, color = egg.egg_id, egg.color
+        self.assertEqual(egg.refresh(), ['color'])
+        self.assertIs(egg.__dict__['egg_id'], egg_id)
+        self.assertNotIn('color', egg.__dict__)
+        self.assertEqual(egg.color, 'white')
+
+    def test_refresh_requires_a_url(self):
+        self.assertRaises(ValueError, StaleEgg({'egg_id': 'organic'}).refresh)
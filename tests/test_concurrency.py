@@ -0,0 +1,234 @@
+from unittest import TestCase
+import concurrent.futures
+import contextvars
+import threading
+import time
+
+import responses
+from requests.exceptions import Timeout
+
+from apimodel import APIModel, APIField, NotFound, deadline
+from apimodel.concurrency import SingleFlight, SharedExecutor, configure, \
+    get_executor, set_executor
+
+SERVER_EGG_URL = 'http://example.com/v1/eggs/{0}/'
+current_user = contextvars.ContextVar('current_user', default=None)
+
+
+class Egg(APIModel):
+    fields = {
+        'egg_id': APIField(str),
+    }
+
+    finders = {
+        'egg_id': SERVER_EGG_URL,
+    }
+
+
+class DescribeSingleFlight(TestCase):
+    def setUp(self):
+        self.group = SingleFlight()
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def slow(self, result):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(1)
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    def run_concurrently(self, result, callers=5):
+        with concurrent.futures.ThreadPoolExecutor(callers) as e:
+            futures = [e.submit(self.group.do, 'key', self.slow, result)
+                       for _ in range(callers)]
+            self.started.wait(1)
+            time.sleep(0.05)
+            self.release.set()
+        return futures
+
+    def test_runs_function_once_for_concurrent_callers(self):
+        futures = self.run_concurrently('value')
+        self.assertEqual([f.result() for f in futures], ['value'] * 5)
+        self.assertEqual(self.calls, 1)
+
+    def test_passes_errors_to_all_callers(self):
+        futures = self.run_concurrently(NotFound('missing'))
+        for future in futures:
+            self.assertIsInstance(future.exception(), NotFound)
+        self.assertEqual(self.calls, 1)
+
+    def start_leader(self, result):
+        pool = concurrent.futures.ThreadPoolExecutor(1)
+        self.addCleanup(pool.shutdown)
+        self.addCleanup(self.release.set)
+        leader = pool.submit(self.group.do, 'key', self.slow, result)
+        self.started.wait(1)
+        return leader
+
+    def test_waiting_callers_give_up_after_timeout(self):
+        leader = self.start_leader('value')
+        self.assertRaises(Timeout, self.group.do, 'key', self.slow, 'value',
+                          timeout=0.01)
+        self.release.set()
+        self.assertEqual(leader.result(), 'value')
+        self.assertEqual(self.calls, 1)
+
+    def test_waiting_callers_retry_chosen_errors(self):
+        leader = self.start_leader(NotFound('missing'))
+        with concurrent.futures.ThreadPoolExecutor(1) as e:
+            follower = e.submit(
+                self.group.do, 'key', self.slow, 'value',
+                retry=lambda error: isinstance(error, NotFound))
+            time.sleep(0.05)
+            self.release.set()
+        self.assertIsInstance(leader.exception(), NotFound)
+        self.assertEqual(follower.result(), 'value')
+        self.assertEqual(self.calls, 2)
+
+    def test_forgets_key_after_completion(self):
+        self.release.set()
+        self.group.do('key', self.slow, 1)
+        self.group.do('key', self.slow, 2)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.group.in_flight(), 0)
+
+
+class DescribeCoalescedFetches(TestCase):
+    @responses.activate
+    def test_concurrent_lookups_share_one_request(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def callback(request):
+            started.set()
+            release.wait(1)
+            return 200, {}, '{"egg_id": "organic"}'
+
+        responses.add_callback(responses.GET, SERVER_EGG_URL.format('organic'),
+                               callback=callback,
+                               content_type='application/json')
+        with concurrent.futures.ThreadPoolExecutor(4) as e:
+            futures = [e.submit(Egg, egg_id='organic') for _ in range(4)]
+            started.wait(1)
+            time.sleep(0.05)
+            release.set()
+        self.assertEqual([f.result().egg_id for f in futures],
+                         ['organic'] * 4)
+        self.assertEqual(len(responses.calls), 1)
+
+
+class DescribeSharedExecutor(TestCase):
+    def setUp(self):
+        self.executor = SharedExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_map_preserves_order(self):
+        self.assertEqual(self.executor.map(lambda x: x * 2, range(10)),
+                         [x * 2 for x in range(10)])
+
+    def test_map_of_nothing_is_empty(self):
+        self.assertEqual(self.executor.map(str, []), [])
+
+    def test_nested_maps_do_not_deadlock(self):
+        def inner(x):
+            return sum(self.executor.map(lambda y: x * y, range(5)))
+
+        def outer(x):
+            return self.executor.map(inner, range(x))
+
+        self.assertEqual(self.executor.map(outer, range(4))[3], [0, 10, 20])
+
+    def test_raises_first_error(self):
+        def fail(x):
+            if x == 3:
+                raise NotFound('missing')
+            return x
+
+        self.assertRaises(NotFound, self.executor.map, fail, range(10))
+
+    def test_propagates_context(self):
+        current_user.set('alice')
+        self.assertEqual(
+            self.executor.map(lambda x: current_user.get(), range(4)),
+            ['alice'] * 4)
+
+    def test_deferred_runs_in_caller_when_pool_is_busy(self):
+        release = threading.Event()
+        busy = [self.executor.defer(release.wait, 1) for _ in range(2)]
+        deferred = self.executor.defer(threading.current_thread)
+        self.assertIs(deferred.result(), threading.current_thread())
+        release.set()
+        self.assertEqual([d.result() for d in busy], [True, True])
+
+    def test_deferred_reraises_errors(self):
+        deferred = self.executor.defer(int, 'x')
+        self.assertRaises(ValueError, deferred.result)
+
+    def test_caps_requests_per_host(self):
+        executor = SharedExecutor(max_workers=8, max_per_host=2)
+        lock = threading.Lock()
+        active = []
+        peak = []
+
+        def request(url):
+            with executor.host_slot(url):
+                with lock:
+                    active.append(url)
+                    peak.append(len(active))
+                time.sleep(0.01)
+                with lock:
+                    active.remove(url)
+
+        executor.map(request, ['http://example.com/'] * 10)
+        executor.shutdown()
+        self.assertLessEqual(max(peak), 2)
+
+    def test_host_slot_gives_up_at_deadline(self):
+        executor = SharedExecutor(max_workers=1, max_per_host=1)
+        with executor.host_slot('http://example.com/a'):
+            with deadline(0.01):
+                with self.assertRaises(Timeout):
+                    with executor.host_slot('http://example.com/b'):
+                        pass
+        with deadline(0.01):
+            with executor.host_slot('http://example.com/b'):
+                pass
+
+    def test_bounds_background_refreshes(self):
+        executor = SharedExecutor(max_workers=4, max_refreshes=2)
+        release = threading.Event()
+        first = executor.refresh('a', release.wait, 1)
+        self.assertIsNone(executor.refresh('a', release.wait, 1))
+        second = executor.refresh('b', release.wait, 1)
+        self.assertIsNone(executor.refresh('c', release.wait, 1))
+        release.set()
+        self.assertEqual([first.result(), second.result()], [True, True])
+        self.assertIsNotNone(executor.refresh('c', int))
+        executor.shutdown()
+
+
+class DescribeConfigure(TestCase):
+    def setUp(self):
+        self.original = get_executor()
+        set_executor(SharedExecutor())
+
+    def tearDown(self):
+        get_executor().shutdown()
+        set_executor(self.original)
+
+    def test_keeps_settings_not_given(self):
+        configure(max_workers=4, max_per_host=2, max_refreshes=1)
+        configure(max_workers=8)
+        executor = get_executor()
+        self.assertEqual((executor.max_workers, executor.max_per_host,
+                          executor.max_refreshes), (8, 2, 1))
+
+    def test_per_host_cap_can_be_removed(self):
+        configure(max_per_host=2)
+        configure(max_per_host=0)
+        self.assertEqual(get_executor().max_per_host, 0)
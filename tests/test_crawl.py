@@ -0,0 +1,123 @@
+from unittest import TestCase
+import json
+import pickle
+
+import responses
+
+from apimodel import APICollection, APICollectionField, APIField, \
+    APIModel, APIModelField, NotFound
+from apimodel.crawl import Snapshot, crawl
+
+SERVER_URL = 'http://example.com/v1/{0}/{1}/'
+SERVER_BASKET_COLLECTION_URL = 'http://example.com/v1/baskets/'
+
+
+class Candy(APIModel):
+    fields = {
+        'candy_id': APIField(str),
+    }
+
+
+class Egg(APIModel):
+    fields = {
+        'egg_id': APIField(str),
+        'weight': APIField(int),
+        'candy': APIModelField(Candy),
+    }
+
+
+class Basket(APIModel):
+    fields = {
+        'basket_id': APIField(str),
+        'eggs': APICollectionField(Egg),
+        'egg': APIModelField(Egg),
+    }
+
+
+def add(kind, key, data, status=200):
+    responses.add(responses.GET, SERVER_URL.format(kind, key),
+                  body=json.dumps(data), status=status,
+                  content_type='application/json')
+
+
+def add_graph(egg_status=200):
+    responses.add(responses.GET, SERVER_BASKET_COLLECTION_URL,
+                  body=json.dumps([SERVER_URL.format('baskets', 'a'),
+                                   SERVER_URL.format('baskets', 'b')]),
+                  content_type='application/json')
+    for basket_id in ('a', 'b'):
+        add('baskets', basket_id, {
+            'basket_id': basket_id,
+            'eggs': [SERVER_URL.format('eggs', 'organic'),
+                     {'egg_id': basket_id, 'weight': '50',
+                      'candy': {'candy_id': 'inline'}}],
+            'egg': SERVER_URL.format('eggs', 'organic'),
+        })
+    add('eggs', 'organic', {'egg_id': 'organic', 'weight': '61',
+                            'candy': SERVER_URL.format('candies', 'mint')},
+        status=egg_status)
+    add('candies', 'mint', {'candy_id': 'mint'})
+
+
+class DescribeCrawl(TestCase):
+    def setUp(self):
+        self.root = APICollection(model=Basket,
+                                  data=SERVER_BASKET_COLLECTION_URL,
+                                  lazy_load=True)
+
+    def by_url(self, snapshots):
+        return {snapshot.url: snapshot for snapshot in snapshots}
+
+    @responses.activate
+    def test_streams_snapshots_of_the_graph(self):
+        add_graph()
+        snapshots = self.by_url(crawl(self.root, 'eggs__candy', 'egg',
+                                      processes=2, batch_size=1))
+        self.assertEqual(set(snapshots), {
+            SERVER_URL.format('baskets', 'a'),
+            SERVER_URL.format('baskets', 'b'),
+            SERVER_URL.format('eggs', 'organic'),
+            SERVER_URL.format('candies', 'mint'),
+        })
+        egg = snapshots[SERVER_URL.format('eggs', 'organic')]
+        self.assertIs(egg.model, Egg)
+        self.assertEqual(egg.fields, {'egg_id': 'organic', 'weight': 61})
+        self.assertEqual(egg.links,
+                         {'candy': SERVER_URL.format('candies', 'mint')})
+
+    @responses.activate
+    def test_links_collections_and_embedded_models(self):
+        add_graph()
+        snapshots = self.by_url(crawl(self.root, 'eggs__candy',
+                                      processes=1))
+        basket = snapshots[SERVER_URL.format('baskets', 'a')]
+        linked, embedded = basket.links['eggs']
+        self.assertEqual(linked, SERVER_URL.format('eggs', 'organic'))
+        self.assertEqual(embedded, Snapshot(
+            Egg, None, {'egg_id': 'a', 'weight': 50},
+            {'candy': Snapshot(Candy, None, {'candy_id': 'inline'}, {})}))
+        self.assertNotIn('egg', basket.links)
+
+    @responses.activate
+    def test_visits_each_url_once(self):
+        add_graph()
+        crawler = crawl(self.root, 'eggs__candy', 'egg', processes=2)
+        urls = [snapshot.url for snapshot in crawler]
+        self.assertEqual(len(urls), len(set(urls)))
+        self.assertIn(SERVER_URL.format('eggs', 'organic'), crawler.visited)
+
+    @responses.activate
+    def test_records_errors(self):
+        add_graph(egg_status=404)
+        crawler = crawl(self.root, 'egg', processes=1)
+        self.assertEqual(len(list(crawler)), 2)
+        self.assertIsInstance(
+            crawler.errors[SERVER_URL.format('eggs', 'organic')], NotFound)
+
+    def test_snapshots_can_be_pickled(self):
+        snapshot = Snapshot(Egg, SERVER_URL.format('eggs', 'organic'),
+                            {'egg_id': 'organic'}, {})
+        self.assertEqual(pickle.loads(pickle.dumps(snapshot)), snapshot)
+
+    def test_rejects_non_relation_fields(self):
+        self.assertRaises(ValueError, crawl, self.root, 'eggs__weight')
@@ -0,0 +1,210 @@
+from unittest import TestCase
+import concurrent.futures
+import json
+import threading
+import time
+
+import responses
+from requests.exceptions import Timeout
+
+from apimodel import APICollection, APIModel, APIField, BulkResult, \
+    DeadlineExceeded, NotFound, Transport, deadline
+from apimodel.concurrency import SharedExecutor
+from apimodel.deadlines import remaining
+
+SERVER_EGG_URL = 'http://example.com/v1/eggs/{0}/'
+
+
+class RecordingTransport(Transport):
+    def get(self, url, **kwargs):
+        self.timeout_used = kwargs.get('timeout')
+        return super(RecordingTransport, self).get(url, **kwargs)
+
+
+class Egg(APIModel):
+    transport = RecordingTransport()
+
+    fields = {
+        'egg_id': APIField(str),
+    }
+
+    finders = {
+        'egg_id': SERVER_EGG_URL,
+    }
+
+
+def add_egg(egg_id, status=200):
+    responses.add(responses.GET, SERVER_EGG_URL.format(egg_id),
+                  body=json.dumps({'egg_id': egg_id}), status=status,
+                  content_type='application/json')
+
+
+class DescribeDeadline(TestCase):
+    def test_reports_time_left(self):
+        self.assertIsNone(remaining())
+        with deadline(10):
+            self.assertTrue(9 < remaining() <= 10)
+        self.assertIsNone(remaining())
+
+    def test_nested_deadlines_only_shorten(self):
+        with deadline(1):
+            with deadline(10):
+                self.assertLessEqual(remaining(), 1)
+            with deadline(0.5):
+                self.assertLessEqual(remaining(), 0.5)
+
+    def test_follows_context_into_workers(self):
+        executor = SharedExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        with deadline(10):
+            left = executor.map(lambda i: remaining(), range(4))
+        self.assertTrue(all(value is not None for value in left))
+
+    @responses.activate
+    def test_passes_time_left_as_request_timeout(self):
+        add_egg('organic')
+        Egg.transport.timeout = None
+        with deadline(5):
+            Egg(egg_id='organic')
+        self.assertTrue(0 < Egg.transport.timeout_used <= 5)
+
+    @responses.activate
+    def test_keeps_shorter_transport_timeout(self):
+        add_egg('organic')
+        Egg.transport.timeout = 1
+        self.addCleanup(setattr, Egg.transport, 'timeout', None)
+        with deadline(5):
+            Egg(egg_id='organic')
+        self.assertEqual(Egg.transport.timeout_used, 1)
+
+    @responses.activate
+    def test_raises_once_deadline_has_passed(self):
+        add_egg('organic')
+        with deadline(0.01):
+            time.sleep(0.02)
+            with self.assertRaises(DeadlineExceeded):
+                Egg(egg_id='organic')
+        self.assertEqual(len(responses.calls), 0)
+
+
+class SlotEgg(Egg):
+    transport = RecordingTransport()
+    executor = SharedExecutor(max_workers=1, max_per_host=1)
+
+
+class DescribeHostSlotWait(TestCase):
+    def hold_slot(self, seconds):
+        def hold():
+            with SlotEgg.executor.host_slot(SERVER_EGG_URL):
+                held.set()
+                time.sleep(seconds)
+
+        held = threading.Event()
+        thread = threading.Thread(target=hold)
+        thread.start()
+        self.addCleanup(thread.join)
+        held.wait(1)
+
+    @responses.activate
+    def test_request_timeout_excludes_slot_wait(self):
+        add_egg('organic')
+        self.hold_slot(0.2)
+        with deadline(5):
+            SlotEgg(egg_id='organic')
+        self.assertLess(SlotEgg.transport.timeout_used, 4.85)
+
+    @responses.activate
+    def test_raises_when_deadline_passes_waiting_for_slot(self):
+        add_egg('organic')
+        self.hold_slot(0.2)
+        with deadline(0.05):
+            self.assertRaises(DeadlineExceeded, SlotEgg, egg_id='organic')
+        self.assertEqual(len(responses.calls), 0)
+
+
+class DescribeCoalescedDeadlines(TestCase):
+    def setUp(self):
+        self.started = threading.Event()
+        self.pool = concurrent.futures.ThreadPoolExecutor(1)
+        self.addCleanup(self.pool.shutdown)
+
+    def add_slow_egg(self, respond):
+        def callback(request):
+            first = not self.started.is_set()
+            self.started.set()
+            return respond(first)
+
+        responses.add_callback(responses.GET, SERVER_EGG_URL.format('organic'),
+                               callback=callback,
+                               content_type='application/json')
+
+    def load(self, seconds=None):
+        if seconds is None:
+            return Egg(egg_id='organic')
+        with deadline(seconds):
+            return Egg(egg_id='organic')
+
+    @responses.activate
+    def test_waiting_lookup_keeps_its_own_deadline(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def respond(first):
+            release.wait(1)
+            return 200, {}, json.dumps({'egg_id': 'organic'})
+
+        self.add_slow_egg(respond)
+        leader = self.pool.submit(self.load)
+        self.started.wait(1)
+        self.assertRaises(DeadlineExceeded, self.load, 0.05)
+        release.set()
+        self.assertEqual(leader.result().egg_id, 'organic')
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_waiting_lookup_outlives_shorter_deadline(self):
+        def respond(first):
+            if first:
+                time.sleep(0.2)
+                raise Timeout()
+            return 200, {}, json.dumps({'egg_id': 'organic'})
+
+        self.add_slow_egg(respond)
+        leader = self.pool.submit(self.load, 0.1)
+        self.started.wait(1)
+        self.assertEqual(self.load().egg_id, 'organic')
+        self.assertIsInstance(leader.exception(), DeadlineExceeded)
+        self.assertEqual(len(responses.calls), 2)
+
+class DescribeCollectionResults(TestCase):
+    def setUp(self):
+        self.collection = APICollection(model=Egg, data=[
+            SERVER_EGG_URL.format('organic'),
+            SERVER_EGG_URL.format('missing'),
+        ])
+
+    @responses.activate
+    def test_returns_per_element_failures(self):
+        add_egg('organic')
+        add_egg('missing', status=404)
+        results = self.collection.results()
+        self.assertIsInstance(results, BulkResult)
+        self.assertEqual(results[0].egg_id, 'organic')
+        self.assertIsNone(results[1])
+        self.assertIsInstance(results.errors[1], NotFound)
+        self.assertFalse(hasattr(self.collection, '_models'))
+
+    @responses.activate
+    def test_reports_elements_past_deadline(self):
+        with deadline(0):
+            results = self.collection.results()
+        self.assertEqual(list(results), [None, None])
+        self.assertIsInstance(results.errors[0], DeadlineExceeded)
+
+    @responses.activate
+    def test_keeps_models_when_all_load(self):
+        add_egg('organic')
+        add_egg('missing')
+        results = self.collection.results()
+        self.assertEqual(results.errors, {})
+        self.assertEqual(self.collection.all(), list(results))
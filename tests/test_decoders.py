@@ -0,0 +1,91 @@
+from unittest import TestCase, skipUnless
+import importlib.util
+import json
+
+import responses
+
+from apimodel import APICollection, APIModel, APIField, \
+    available_decoders, get_default_decoder, set_default_decoder
+from apimodel.decoders import stdlib_decode
+
+SERVER_EGG_URL = 'http://example.com/v1/eggs/{0}/'
+SERVER_EGG_COLLECTION_URL = 'http://example.com/v1/eggs/'
+HAS_ORJSON = importlib.util.find_spec('orjson') is not None
+
+
+def upper_decode(content):
+    return {key: value.upper() for key, value in json.loads(content).items()}
+
+
+class Egg(APIModel):
+    fields = {
+        'egg_id': APIField(str),
+    }
+
+    finders = {
+        'egg_id': SERVER_EGG_URL,
+    }
+
+
+class UpperEgg(Egg):
+    decoder = upper_decode
+
+
+def add_egg():
+    responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                  body=b'{"egg_id": "organic"}',
+                  content_type='application/json')
+
+
+class DescribeDecoders(TestCase):
+    def tearDown(self):
+        set_default_decoder(next(iter(available_decoders().values())))
+
+    def test_stdlib_decoder_is_always_available(self):
+        self.assertIs(available_decoders()['json'], stdlib_decode)
+        self.assertEqual(stdlib_decode(b'[1, 2]'), [1, 2])
+
+    @skipUnless(HAS_ORJSON, 'orjson is not installed')
+    def test_prefers_orjson(self):
+        import orjson
+        self.assertIs(get_default_decoder(), orjson.loads)
+
+    @responses.activate
+    def test_models_use_default_decoder(self):
+        add_egg()
+        set_default_decoder(upper_decode)
+        self.assertEqual(Egg(egg_id='organic').egg_id, 'ORGANIC')
+
+    @responses.activate
+    def test_models_can_set_their_own_decoder(self):
+        add_egg()
+        self.assertEqual(UpperEgg(egg_id='organic').egg_id, 'ORGANIC')
+        self.assertIs(UpperEgg({}).get_decoder(), upper_decode)
+
+    def test_collections_use_model_decoder(self):
+        collection = APICollection(model=UpperEgg, data=[])
+        self.assertIs(collection.get_decoder(), upper_decode)
+
+    def test_keeps_methods_bound_to_their_instance(self):
+        class ParsingCollection(APICollection):
+            def parse(self, content):
+                return upper_decode(content)
+
+        collection = ParsingCollection(model=Egg, data=[])
+        collection.decoder = collection.parse
+        self.assertEqual(collection.get_decoder(), collection.parse)
+
+    def test_accepts_static_methods(self):
+        class StaticEgg(Egg):
+            decoder = staticmethod(upper_decode)
+
+        self.assertIs(StaticEgg({}).get_decoder(), upper_decode)
+
+    @responses.activate
+    def test_reports_invalid_json(self):
+        responses.add(responses.GET, SERVER_EGG_URL.format('bad'),
+                      body=b'{"egg_id"', content_type='application/json')
+        for decoder in available_decoders().values():
+            set_default_decoder(decoder)
+            with self.assertRaises(ValueError):
+                Egg(egg_id='bad')
@@ -0,0 +1,159 @@
+from unittest import TestCase
+import json
+
+import responses
+
+from apimodel import APICollection, APIModel, APIField, APIModelField, \
+    MetricsCollector, Observer, ResponseCache, add_observer, remove_observer
+from apimodel.instrumentation import Histogram, url_template
+
+SERVER_BASKET_URL = 'http://example.com/v1/baskets/{0}/'
+SERVER_EGG_URL = 'http://example.com/v1/eggs/{0}/'
+
+
+class Egg(APIModel):
+    cache = ResponseCache()
+    cache_ttl = 60
+
+    fields = {
+        'egg_id': APIField(str),
+    }
+
+    finders = {
+        'egg_id': SERVER_EGG_URL,
+    }
+
+
+class Basket(APIModel):
+    fields = {
+        'basket_id': APIField(str),
+        'egg': APIModelField(Egg),
+    }
+
+    finders = {
+        'basket_id': SERVER_BASKET_URL,
+    }
+
+
+class RecordingObserver(Observer):
+    def __init__(self):
+        self.events = []
+
+    def request_started(self, resource, url):
+        self.events.append(('request_started', url))
+
+    def request_finished(self, resource, url, status, size, seconds,
+                         error=None):
+        self.events.append(('request_finished', url, status, size))
+
+    def cache_lookup(self, resource, url, result):
+        self.events.append(('cache_lookup', url, result))
+
+    def field_loaded(self, model, name, seconds):
+        self.events.append(('field_loaded', type(model).__name__, name))
+
+    def collection_fanout(self, collection, size):
+        self.events.append(('collection_fanout', size))
+
+
+def add_egg(egg_id):
+    responses.add(responses.GET, SERVER_EGG_URL.format(egg_id),
+                  body=json.dumps({'egg_id': egg_id}),
+                  content_type='application/json')
+
+
+class ObserverTestCase(TestCase):
+    def setUp(self):
+        Egg.cache.clear()
+        self.observer = add_observer(self.make_observer())
+        self.addCleanup(remove_observer, self.observer)
+
+
+class DescribeObservers(ObserverTestCase):
+    make_observer = RecordingObserver
+
+    @responses.activate
+    def test_reports_requests_and_cache_lookups(self):
+        add_egg('organic')
+        url = SERVER_EGG_URL.format('organic')
+        Egg(egg_id='organic')
+        Egg(egg_id='organic')
+        self.assertEqual(self.observer.events, [
+            ('cache_lookup', url, 'miss'),
+            ('request_started', url),
+            ('request_finished', url, 200, 21),
+            ('cache_lookup', url, 'hit'),
+        ])
+
+    @responses.activate
+    def test_reports_failed_requests(self):
+        responses.add(responses.GET, SERVER_EGG_URL.format('missing'),
+                      status=404)
+        with self.assertRaises(BaseException):
+            Egg(egg_id='missing')
+        self.assertIn(('request_finished', SERVER_EGG_URL.format('missing'),
+                       404, 0), self.observer.events)
+
+    def test_reports_field_loads_and_fanout(self):
+        collection = APICollection(model=Egg, data=[{'egg_id': 'a'},
+                                                    {'egg_id': 'b'}])
+        [egg.egg_id for egg in collection.all()]
+        self.assertEqual(self.observer.events, [
+            ('collection_fanout', 2),
+            ('field_loaded', 'Egg', 'egg_id'),
+            ('field_loaded', 'Egg', 'egg_id'),
+        ])
+
+    def test_removed_observers_are_not_notified(self):
+        remove_observer(self.observer)
+        Egg({'egg_id': 'a'}).egg_id
+        self.assertEqual(self.observer.events, [])
+
+
+class DescribeMetricsCollector(ObserverTestCase):
+    make_observer = MetricsCollector
+
+    @responses.activate
+    def test_groups_latency_by_model_and_template(self):
+        add_egg('a')
+        add_egg('b')
+        Egg(egg_id='a')
+        Egg(egg_id='b')
+        snapshot = self.observer.snapshot()
+        self.assertEqual(snapshot['requests'], 2)
+        self.assertEqual(snapshot['by_resource']['Egg']['count'], 2)
+        self.assertEqual(snapshot['by_template'][SERVER_EGG_URL]['count'], 2)
+        self.assertEqual(snapshot['cache']['miss'], 2)
+
+    @responses.activate
+    def test_flags_n_plus_one_access(self):
+        self.observer.n_plus_one_threshold = 3
+        baskets = []
+        for i in range(3):
+            add_egg(str(i))
+            baskets.append(Basket({'basket_id': str(i),
+                                   'egg': SERVER_EGG_URL.format(i)}))
+        for basket in baskets:
+            basket.egg.egg_id
+        self.assertEqual(self.observer.n_plus_one(), [(Basket, 'egg', 3)])
+        self.assertIn('Basket.egg made 3 requests', self.observer.summary())
+
+    def test_summary_without_requests(self):
+        self.assertIn('0 requests', self.observer.summary())
+        self.assertNotIn('N+1', self.observer.summary())
+
+
+class DescribeHistogram(TestCase):
+    def test_reports_percentiles(self):
+        histogram = Histogram()
+        for seconds in [0.001] * 90 + [0.3] * 10:
+            histogram.add(seconds)
+        self.assertEqual(histogram.percentile(50), 0.001)
+        self.assertEqual(histogram.percentile(95), 0.3)
+        self.assertEqual(histogram.count, 100)
+
+
+class DescribeURLTemplate(TestCase):
+    def test_replaces_id_segments(self):
+        self.assertEqual(url_template('http://example.com/v1/eggs/42/?a=1'),
+                         'http://example.com/v1/eggs/{}/')
@@ -0,0 +1,188 @@
+from unittest import TestCase
+import email.utils
+import json
+import threading
+import time
+
+import responses
+from requests.exceptions import Timeout
+
+from apimodel import AdaptiveLimiter, APIField, APIModel, NotFound, \
+    RateLimiter, Throttled, TokenBucket, Transport, deadline, retry_after
+
+SERVER_EGG_URL = 'http://example.com/v1/eggs/{0}/'
+
+
+class DescribeRetryAfter(TestCase):
+    def test_reads_seconds(self):
+        self.assertEqual(retry_after({'Retry-After': '3'}), 3.0)
+
+    def test_reads_http_dates(self):
+        date = email.utils.formatdate(time.time() + 60, usegmt=True)
+        self.assertAlmostEqual(retry_after({'Retry-After': date}), 60, delta=2)
+
+    def test_ignores_missing_or_invalid_values(self):
+        self.assertIsNone(retry_after({}))
+        self.assertIsNone(retry_after({'Retry-After': 'soon'}))
+
+
+class DescribeTokenBucket(TestCase):
+    def test_allows_a_burst_then_spaces_requests(self):
+        bucket = TokenBucket(10, burst=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+    def test_pause_holds_back_requests(self):
+        bucket = TokenBucket(100)
+        bucket.pause(1)
+        self.assertAlmostEqual(bucket.reserve(), 1, delta=0.05)
+
+
+    def test_acquire_gives_up_at_deadline(self):
+        bucket = TokenBucket(10, burst=1)
+        bucket.acquire()
+        with deadline(0.01):
+            self.assertRaises(Timeout, bucket.acquire)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+
+class DescribeRateLimiter(TestCase):
+    def test_limits_each_host_separately(self):
+        limiter = RateLimiter(1, burst=1)
+        self.assertEqual(limiter.reserve('http://a.example.com/x'), 0)
+        self.assertEqual(limiter.reserve('http://b.example.com/x'), 0)
+        self.assertGreater(limiter.reserve('http://a.example.com/y'), 0)
+
+    def test_can_limit_by_url_template(self):
+        limiter = RateLimiter(1, burst=1, per='template')
+        self.assertEqual(limiter.reserve(SERVER_EGG_URL.format(1)), 0)
+        self.assertGreater(limiter.reserve(SERVER_EGG_URL.format(2)), 0)
+        self.assertEqual(limiter.reserve('http://example.com/v1/baskets/'),
+                         0)
+
+    def test_rejects_unknown_keys(self):
+        self.assertRaises(ValueError, RateLimiter, 1, per='path')
+
+
+class DescribeAdaptiveLimiter(TestCase):
+    def setUp(self):
+        self.url = SERVER_EGG_URL.format('organic')
+
+    def test_grows_limit_on_success(self):
+        limiter = AdaptiveLimiter(initial=2)
+        for _ in range(4):
+            with limiter.slot(self.url):
+                pass
+        self.assertGreater(limiter.limit(self.url), 3)
+
+    def test_backs_off_once_per_round_trip(self):
+        limiter = AdaptiveLimiter(initial=8)
+        with limiter.slot(self.url) as slot:
+            slot.ok = False
+        self.assertEqual(limiter.limit(self.url), 4)
+        time.sleep(0.01)
+        with limiter.slot(self.url) as slot:
+            time.sleep(0.02)
+            slot.ok = False
+        self.assertEqual(limiter.limit(self.url), 2)
+
+    def test_counts_exceptions_as_failures(self):
+        limiter = AdaptiveLimiter(initial=4)
+        with self.assertRaises(RuntimeError):
+            with limiter.slot(self.url):
+                raise RuntimeError()
+        self.assertEqual(limiter.limit(self.url), 2)
+
+    def test_bounds_requests_in_flight(self):
+        limiter = AdaptiveLimiter(initial=2, maximum=2)
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+
+        def work():
+            with limiter.slot(self.url):
+                with lock:
+                    state['active'] += 1
+                    state['peak'] = max(state['peak'], state['active'])
+                time.sleep(0.02)
+                with lock:
+                    state['active'] -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(state['peak'], 2)
+
+    def test_slot_gives_up_at_deadline(self):
+        limiter = AdaptiveLimiter(initial=1, maximum=1)
+        with limiter.slot(self.url):
+            with deadline(0.01):
+                with self.assertRaises(Timeout):
+                    with limiter.slot(self.url):
+                        pass
+        with deadline(0.01):
+            with limiter.slot(self.url):
+                pass
+
+
+class Egg(APIModel):
+    transport = Transport(retries=0)
+
+    fields = {
+        'egg_id': APIField(str),
+    }
+
+    finders = {
+        'egg_id': SERVER_EGG_URL,
+    }
+
+
+class DescribeThrottling(TestCase):
+    def setUp(self):
+        self.url = SERVER_EGG_URL.format('organic')
+
+    @responses.activate
+    def test_transport_retries_after_requested_delay(self):
+        responses.add(responses.GET, self.url, status=429,
+                      headers={'Retry-After': '0'})
+        responses.add(responses.GET, self.url, json={'egg_id': 'organic'})
+        response = Transport().get(self.url)
+        self.assertEqual(response.json(), {'egg_id': 'organic'})
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_transport_gives_up_on_long_waits(self):
+        responses.add(responses.GET, self.url, status=503,
+                      headers={'Retry-After': '120'})
+        response = Transport().get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_request_timeout_excludes_rate_limit_wait(self):
+        responses.add(responses.GET, self.url, json={'egg_id': 'organic'})
+        transport = Transport(rate_limiter=RateLimiter(5, burst=1))
+        timeouts = []
+        send = transport.session.get
+
+        def get(url, **kwargs):
+            timeouts.append(kwargs['timeout'])
+            return send(url, **kwargs)
+
+        transport.session.get = get
+        transport.get(self.url)
+        with deadline(5):
+            transport.get(self.url)
+        self.assertLess(timeouts[1], 4.85)
+
+    @responses.activate
+    def test_model_raises_throttled(self):
+        responses.add(responses.GET, self.url, status=429,
+                      headers={'Retry-After': '5'},
+                      body=json.dumps({}))
+        with self.assertRaises(Throttled) as raised:
+            Egg(egg_id='organic')
+        self.assertEqual(raised.exception.retry_after, 5)
+        self.assertIsInstance(raised.exception, NotFound)
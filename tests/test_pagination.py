@@ -0,0 +1,144 @@
+from unittest import TestCase
+import json
+
+import responses
+
+from apimodel import APICollection, APICollectionField, APIModel, \
+    APIField, Paginator
+
+SERVER_EGG_PAGE_URL = 'http://example.com/v1/eggs/?page={0}'
+
+
+class Egg(APIModel):
+    fields = {
+        'egg_id': APIField(str),
+    }
+
+
+class EggCollection(APICollection):
+    url = SERVER_EGG_PAGE_URL.format(1)
+    model = Egg
+    paginator = Paginator(prefetch=2)
+
+
+class LinkedEggCollection(EggCollection):
+    paginator = Paginator(items=None, next=None)
+
+
+class PagedEgg(Egg):
+    paginator = Paginator()
+
+
+class Basket(APIModel):
+    fields = {
+        'eggs': APICollectionField(PagedEgg,
+                                   url=SERVER_EGG_PAGE_URL.format(1)),
+    }
+
+
+def add_pages(pages=3, per_page=2, count=True, links=False):
+    for page in range(1, pages + 1):
+        eggs = [{'egg_id': '{0}-{1}'.format(page, i)}
+                for i in range(per_page)]
+        next_url = None
+        if page < pages:
+            next_url = '/v1/eggs/?page={0}'.format(page + 1)
+        headers = {}
+        if links:
+            body = eggs
+            if next_url:
+                headers['Link'] = '<{0}>; rel="next"'.format(next_url)
+        else:
+            body = {'results': eggs, 'next': next_url}
+            if count:
+                body['count'] = pages * per_page
+        responses.add(responses.GET, SERVER_EGG_PAGE_URL.format(page),
+                      body=json.dumps(body), headers=headers,
+                      content_type='application/json')
+
+
+class DescribePaginator(TestCase):
+    def setUp(self):
+        self.paginator = Paginator()
+
+    def test_extracts_items(self):
+        self.assertEqual(self.paginator.items({'results': [1]}), [1])
+        self.assertEqual(Paginator(items='data.eggs').items(
+            {'data': {'eggs': [1]}}), [1])
+
+    def test_rejects_pages_without_items(self):
+        self.assertRaises(ValueError, self.paginator.items, {})
+
+    def test_resolves_relative_next_links(self):
+        self.assertEqual(
+            self.paginator.next_url({'next': '?page=2'}, {},
+                                    'http://example.com/v1/eggs/'),
+            'http://example.com/v1/eggs/?page=2')
+
+    def test_reads_link_header(self):
+        headers = {'Link': '<http://example.com/2>; rel="next", '
+                           '<http://example.com/9>; rel="last"'}
+        self.assertEqual(self.paginator.next_url([], headers, ''),
+                         'http://example.com/2')
+
+    def test_reads_total(self):
+        self.assertEqual(self.paginator.total({'count': 7}), 7)
+        self.assertIsNone(self.paginator.total({}))
+
+
+class DescribePaginatedCollection(TestCase):
+    @responses.activate
+    def test_all_follows_every_page(self):
+        add_pages()
+        eggs = EggCollection().all()
+        self.assertEqual([egg.egg_id for egg in eggs],
+                         ['1-0', '1-1', '2-0', '2-1', '3-0', '3-1'])
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_count_uses_total(self):
+        add_pages()
+        self.assertEqual(EggCollection().count(), 6)
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_count_walks_pages_without_total(self):
+        add_pages(count=False)
+        self.assertEqual(EggCollection().count(), 6)
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_first_reads_only_first_page(self):
+        add_pages()
+        self.assertEqual(EggCollection().first().egg_id, '1-0')
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_iteration_streams_pages(self):
+        add_pages(pages=5)
+        collection = EggCollection()
+        self.assertEqual(len([egg.egg_id for egg in collection]), 10)
+        self.assertEqual(len(collection._data), 2)
+        self.assertEqual(len(responses.calls), 5)
+
+    @responses.activate
+    def test_follows_link_headers(self):
+        add_pages(links=True)
+        self.assertEqual(LinkedEggCollection().count(), 6)
+        self.assertEqual(LinkedEggCollection()[-1].egg_id, '3-1')
+
+    @responses.activate
+    def test_unpaginated_models_are_unaffected(self):
+        responses.add(responses.GET, 'http://example.com/v1/eggs/',
+                      body=json.dumps([{'egg_id': 'organic'}]),
+                      content_type='application/json')
+        collection = APICollection(model=Egg,
+                                   data='http://example.com/v1/eggs/')
+        self.assertEqual(collection.count(), 1)
+
+    @responses.activate
+    def test_prefetch_loads_every_page_of_relations(self):
+        add_pages()
+        baskets = APICollection(model=Basket, data=[{}]).prefetch('eggs')
+        self.assertEqual([egg.egg_id for egg in baskets.all()[0].eggs.all()],
+                         ['1-0', '1-1', '2-0', '2-1', '3-0', '3-1'])
@@ -0,0 +1,171 @@
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+import importlib.util
+import json
+
+import responses
+
+from apimodel import APICollection, APIModel, APIField, APIModelField, \
+    NotFound
+from apimodel.concurrency import SharedExecutor
+
+SERVER_EGG_COLLECTION_URL = 'http://example.com/v1/eggs/'
+EGGS = [
+    {'egg_id': 'organic', 'basket_id': 'b1', 'weight': '61'},
+    {'egg_id': 'regular', 'basket_id': 'b2', 'weight': '55'},
+    {'egg_id': 'brown', 'basket_id': 'b1', 'weight': None},
+]
+HAS_NUMPY = importlib.util.find_spec('numpy') is not None
+
+
+class Egg(APIModel):
+    fields = {
+        'egg_id': APIField(str),
+        'basket_id': APIField(str),
+        'weight': APIField(int),
+        'basket': APIModelField('Egg'),
+    }
+
+
+class EggCollection(APICollection):
+    url = SERVER_EGG_COLLECTION_URL
+    model = Egg
+
+
+def add_eggs():
+    responses.add(responses.GET, SERVER_EGG_COLLECTION_URL,
+                  body=json.dumps(EGGS), content_type='application/json')
+
+
+class DescribeColumnarExtraction(TestCase):
+    @responses.activate
+    def test_values_returns_row_tuples(self):
+        add_eggs()
+        self.assertEqual(EggCollection().values('egg_id', 'weight'),
+                         [('organic', 61), ('regular', 55), ('brown', None)])
+
+    @responses.activate
+    def test_values_does_not_build_models(self):
+        add_eggs()
+        collection = EggCollection()
+        with patch.object(EggCollection, 'create_model') as create_model:
+            collection.values('egg_id')
+        create_model.assert_not_called()
+
+    @responses.activate
+    def test_to_columns_returns_lists_without_numpy(self):
+        add_eggs()
+        columns = EggCollection().to_columns('egg_id', 'weight',
+                                             arrays=False)
+        self.assertEqual(columns, {'egg_id': ['organic', 'regular', 'brown'],
+                                   'weight': [61, 55, None]})
+
+    @responses.activate
+    def test_to_columns_requires_numpy_for_arrays(self):
+        add_eggs()
+        with patch.dict('sys.modules', {'numpy': None}):
+            self.assertEqual(EggCollection().to_columns('egg_id')['egg_id'],
+                             ['organic', 'regular', 'brown'])
+            self.assertRaises(ImportError, EggCollection().to_columns,
+                              'egg_id', arrays=True)
+
+    @skipUnless(HAS_NUMPY, 'NumPy is not installed')
+    @responses.activate
+    def test_to_columns_returns_arrays_with_numpy(self):
+        add_eggs()
+        column = EggCollection().to_columns('egg_id')['egg_id']
+        self.assertEqual(column.tolist(), ['organic', 'regular', 'brown'])
+
+    def test_rejects_relation_fields(self):
+        collection = APICollection(model=Egg, data=EGGS)
+        self.assertRaises(ValueError, collection.values, 'basket')
+
+    def test_rejects_unknown_fields(self):
+        collection = APICollection(model=Egg, data=EGGS)
+        self.assertRaises(ValueError, collection.values, 'color')
+
+    def test_rejects_collections_of_references(self):
+        collection = APICollection(model=Egg,
+                                   data=['http://example.com/v1/eggs/1/'])
+        self.assertRaises(ValueError, collection.values, 'egg_id')
+
+
+class DescribeQueries(TestCase):
+    def setUp(self):
+        self.collection = APICollection(model=Egg, data=EGGS)
+
+    def test_filter_matches_all_conditions(self):
+        eggs = self.collection.filter(basket_id='b1')
+        self.assertEqual([egg.egg_id for egg in eggs], ['organic', 'brown'])
+        eggs = self.collection.filter(basket_id='b1', weight=61)
+        self.assertEqual([egg.egg_id for egg in eggs], ['organic'])
+        self.assertEqual(self.collection.filter(basket_id='b3').count(), 0)
+
+    def test_filter_builds_only_returned_models(self):
+        with patch.object(APICollection, 'create_model',
+                          side_effect=lambda data, lazy_load: data) as create:
+            self.collection.filter(egg_id='regular').all()
+        self.assertEqual(create.call_count, 1)
+
+    def test_reuses_indexes_across_queries(self):
+        self.collection.filter(basket_id='b1')
+        with patch.object(Egg.fields['basket_id'], 'load_column') as load:
+            self.collection.filter(basket_id='b2')
+            self.collection.get(basket_id='b2')
+        load.assert_not_called()
+
+    def test_get_returns_single_match(self):
+        self.assertEqual(self.collection.get(egg_id='brown').basket_id, 'b1')
+
+    def test_get_returns_loaded_models(self):
+        eggs = self.collection.all()
+        self.assertIs(self.collection.get(egg_id='regular'), eggs[1])
+
+    def test_get_rejects_missing_and_ambiguous_matches(self):
+        self.assertRaises(NotFound, self.collection.get, egg_id='white')
+        self.assertRaises(ValueError, self.collection.get, basket_id='b1')
+
+    def test_order_by_sorts_by_fields(self):
+        eggs = self.collection.order_by('weight')
+        self.assertEqual([egg.egg_id for egg in eggs],
+                         ['brown', 'regular', 'organic'])
+        eggs = self.collection.order_by('basket_id', '-egg_id')
+        self.assertEqual([egg.egg_id for egg in eggs],
+                         ['organic', 'brown', 'regular'])
+
+    def test_index_by_maps_values_to_models(self):
+        index = self.collection.index_by('egg_id')
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index['regular'].weight, 55)
+        self.assertNotIn('white', index)
+
+    def test_index_by_requires_unique_values(self):
+        self.assertRaises(ValueError, self.collection.index_by, 'basket_id')
+
+    def test_rejects_unhashable_values(self):
+        class TaggedEgg(Egg):
+            fields = dict(Egg.fields, tags=APIField(list))
+
+        collection = APICollection(model=TaggedEgg, data=[
+            dict(egg, tags=['fresh']) for egg in EGGS])
+        with self.assertRaises(ValueError) as raised:
+            collection.filter(tags=['fresh'])
+        self.assertIn('tags', str(raised.exception))
+
+    def test_results_keep_collection_class_and_settings(self):
+        class LabelledEggCollection(APICollection):
+            def create_model(self, data, lazy_load):
+                return data['egg_id'].upper()
+
+        collection = LabelledEggCollection(model=Egg, data=EGGS)
+        collection.executor = executor = SharedExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        eggs = collection.filter(basket_id='b1').order_by('egg_id')
+        self.assertIsInstance(eggs, LabelledEggCollection)
+        self.assertIs(eggs.executor, executor)
+        self.assertEqual(eggs[0], 'BROWN')
+
+    @responses.activate
+    def test_queries_fetched_collections(self):
+        add_eggs()
+        self.assertEqual(EggCollection().get(egg_id='organic').weight, 61)
@@ -0,0 +1,84 @@
+from unittest import TestCase
+import concurrent.futures
+
+from apimodel import APIModel, APIField, APIModelField, APICollectionField, \
+    ModelRegistry, get_registry
+import test_transport
+
+
+class Shell(APIModel):
+    fields = {
+        'yolk': APIModelField(model='Yolk'),
+        'remote_egg': APIModelField(model='test_transport.Egg'),
+        'yolks': APICollectionField(model='Yolk'),
+    }
+
+
+class Yolk(APIModel):
+    fields = {
+        'color': APIField(str),
+    }
+
+
+class DescribeModelRegistry(TestCase):
+    def test_resolves_forward_references_when_defined(self):
+        self.assertIs(Shell.fields['yolk'].wrapper_func, Yolk)
+        self.assertIs(Shell.fields['yolks'].wrapper_func, Yolk)
+
+    def test_resolves_qualified_references_across_modules(self):
+        self.assertIs(Shell.fields['remote_egg'].wrapper_func,
+                      test_transport.Egg)
+
+    def test_loads_resolved_models(self):
+        shell = Shell({'yolk': {'color': 'yellow'},
+                       'yolks': [{'color': 'red'}]})
+        self.assertEqual(shell.yolk.color, 'yellow')
+        self.assertEqual(shell.yolks.first().color, 'red')
+
+    def test_concurrent_loads_resolve_once(self):
+        class Nest(APIModel):
+            fields = {'yolk': APIModelField(model='Yolk')}
+
+        field = Nest.fields['yolk']
+        self.assertIs(field.wrapper_func, Yolk)
+        with concurrent.futures.ThreadPoolExecutor(4) as e:
+            models = list(e.map(lambda i: field.get_model(), range(20)))
+        self.assertEqual(set(models), {Yolk})
+
+    def test_lookup_prefers_local_models(self):
+        self.assertIs(get_registry().lookup('Yolk', __name__), Yolk)
+
+
+class DescribeValidation(TestCase):
+    def setUp(self):
+        self.registry = ModelRegistry()
+
+    def make_field(self, name):
+        field = APIModelField(model=name)
+        field.owner = Shell
+        field.name = 'thing'
+        self.registry.defer(field)
+        return field
+
+    def test_reports_unknown_models(self):
+        self.make_field('Albumen')
+        with self.assertRaises(ValueError) as context:
+            self.registry.validate()
+        self.assertIn('Shell.thing refers to unknown model "Albumen"',
+                      str(context.exception))
+
+    def test_reports_ambiguous_models(self):
+        models = [type('Albumen', (object,), {'__module__': module})
+                  for module in ('elsewhere', 'nowhere')]
+        for model in models:
+            self.registry.register(model)
+        self.make_field('Albumen')
+        self.assertRaisesRegex(ValueError, 'ambiguous', self.registry.validate)
+
+    def test_resolves_unique_models_from_other_modules(self):
+        albumen = type('Albumen', (object,), {'__module__': 'elsewhere'})
+        self.registry.register(albumen)
+        field = self.make_field('Albumen')
+        self.assertIsInstance(field.wrapper_func, str)
+        self.registry.validate()
+        self.assertIs(field.wrapper_func, albumen)
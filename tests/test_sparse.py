@@ -0,0 +1,132 @@
+from unittest import TestCase
+import json
+
+import responses
+
+from apimodel import APICollection, APIModel, APIField, Paginator, \
+    ResponseCache, Session
+
+SERVER_EGG_URL = 'http://example.com/v1/eggs/{0}/'
+SERVER_EGG_COLLECTION_URL = 'http://example.com/v1/eggs/'
+EGG = {'egg_id': 'organic', 'color': 'brown', 'history': ['x'] * 100}
+
+
+class Egg(APIModel):
+    sparse_fields = 'fields={fields}'
+
+    fields = {
+        'egg_id': APIField(str),
+        'color': APIField(str),
+    }
+
+    finders = {
+        'egg_id': SERVER_EGG_URL,
+    }
+
+
+class CachedEgg(Egg):
+    cache = ResponseCache()
+    cache_ttl = 60
+
+
+class PlainEgg(APIModel):
+    fields = Egg.fields
+    finders = Egg.finders
+
+
+class EggCollection(APICollection):
+    url = SERVER_EGG_COLLECTION_URL
+    model = Egg
+
+
+class PagedEggCollection(EggCollection):
+    paginator = Paginator()
+
+
+def add_egg(query=''):
+    responses.add(responses.GET, SERVER_EGG_URL.format('organic') + query,
+                  body=json.dumps(EGG), content_type='application/json')
+
+
+class DescribeSparseFieldsets(TestCase):
+    @responses.activate
+    def test_requests_declared_fields(self):
+        add_egg('?fields=egg_id,color')
+        egg = Egg(egg_id='organic')
+        self.assertEqual(responses.calls[0].request.params['fields'],
+                         'egg_id,color')
+        self.assertEqual(egg.color, 'brown')
+
+    @responses.activate
+    def test_drops_undeclared_keys(self):
+        add_egg('?fields=egg_id,color')
+        self.assertEqual(Egg(egg_id='organic')._data,
+                         {'egg_id': 'organic', 'color': 'brown'})
+
+    @responses.activate
+    def test_only_requests_a_subset(self):
+        add_egg('?fields=color')
+        egg = Egg(egg_id='organic', only=['color'])
+        self.assertEqual(egg._data, {'color': 'brown'})
+        self.assertIsNone(egg.egg_id)
+
+    @responses.activate
+    def test_only_prunes_models_without_template(self):
+        add_egg()
+        egg = PlainEgg(egg_id='organic', only=['egg_id'])
+        self.assertEqual(egg._data, {'egg_id': 'organic'})
+        self.assertNotIn('?', responses.calls[0].request.url)
+
+    def test_only_rejects_unknown_fields(self):
+        self.assertRaises(ValueError, Egg, egg_id='organic', only=['size'])
+
+    def test_models_are_not_projected_by_default(self):
+        self.assertEqual(PlainEgg._identity_key(egg_id='organic'),
+                         (PlainEgg, SERVER_EGG_URL.format('organic')))
+
+    @responses.activate
+    def test_sessions_keep_projections_apart(self):
+        add_egg('?fields=egg_id,color')
+        add_egg('?fields=color')
+        with Session():
+            full = Egg(egg_id='organic')
+            partial = Egg(egg_id='organic', only=['color'])
+        self.assertIsNot(full, partial)
+
+    @responses.activate
+    def test_prunes_collection_elements(self):
+        responses.add(responses.GET,
+                      SERVER_EGG_COLLECTION_URL + '?fields=egg_id,color',
+                      body=json.dumps([EGG, EGG]),
+                      content_type='application/json')
+        self.assertEqual(EggCollection().values('egg_id', 'color'),
+                         [('organic', 'brown')] * 2)
+        self.assertNotIn('history', EggCollection()._data[0])
+
+    @responses.activate
+    def test_prunes_every_page(self):
+        pages = [{'results': [EGG], 'next': '/v1/eggs/?page=2'},
+                 {'results': [EGG], 'next': None}]
+        responses.add(responses.GET,
+                      SERVER_EGG_COLLECTION_URL + '?fields=egg_id,color',
+                      body=json.dumps(pages[0]),
+                      content_type='application/json')
+        responses.add(responses.GET, SERVER_EGG_COLLECTION_URL + '?page=2',
+                      body=json.dumps(pages[1]),
+                      content_type='application/json')
+        collection = PagedEggCollection()
+        collection._load_pages()
+        self.assertEqual([sorted(egg) for egg in collection._data],
+                         [['color', 'egg_id']] * 2)
+
+    @responses.activate
+    def test_invalidates_projected_entries(self):
+        add_egg('?fields=egg_id,color')
+        add_egg('?fields=egg_id')
+        CachedEgg(egg_id='organic')
+        CachedEgg(egg_id='organic', only=['egg_id'])
+        self.assertTrue(CachedEgg.invalidate(egg_id='organic'))
+        self.assertTrue(CachedEgg.invalidate(egg_id='organic',
+                                             only=['egg_id']))
+        CachedEgg(egg_id='organic')
+        self.assertEqual(len(responses.calls), 3)
@@ -0,0 +1,128 @@
+from unittest import TestCase
+import json
+import time
+
+import responses
+
+from apimodel import APICollection, APIModel, APIField, \
+    DeadlineExceeded, NotFound, Observer, add_observer, deadline, \
+    remove_observer
+from apimodel.streaming import iter_json_array
+
+SERVER_EGG_COLLECTION_URL = 'http://example.com/v1/eggs/'
+EGGS = [{'egg_id': 'egg-{0}'.format(i), 'note': 'ü' * i} for i in range(20)]
+
+
+def chunked(document, size=7):
+    data = json.dumps(document).encode()
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class Egg(APIModel):
+    fields = {
+        'egg_id': APIField(str),
+    }
+
+
+class EggCollection(APICollection):
+    url = SERVER_EGG_COLLECTION_URL
+    model = Egg
+    stream = True
+    stream_chunk_size = 16
+
+
+class EnvelopedEggCollection(EggCollection):
+    stream_path = 'data.eggs'
+
+
+class DescribeIterJSONArray(TestCase):
+    def test_yields_array_elements(self):
+        self.assertEqual(list(iter_json_array(chunked(EGGS))), EGGS)
+
+    def test_handles_empty_arrays(self):
+        self.assertEqual(list(iter_json_array([b' [ ] '])), [])
+
+    def test_does_not_split_numbers_across_chunks(self):
+        self.assertEqual(list(iter_json_array([b'[1', b'23,4', b'5]'])),
+                         [123, 45])
+
+    def test_splits_input_at_every_byte(self):
+        document = [1.5, -2e10, 3E+2, 0.25e-3, 12, 'caf\u00e9', True, None,
+                    {'weight': -61.5, 'tags': [1, 2.0]}]
+        body = json.dumps(document, ensure_ascii=False).encode()
+        chunks = [body[i:i + 1] for i in range(len(body))]
+        self.assertEqual(list(iter_json_array(chunks)), document)
+
+    def test_finds_array_inside_envelope(self):
+        document = {'meta': {'count': 20, 'tags': [1, 2]},
+                    'data': {'eggs': EGGS}}
+        self.assertEqual(
+            list(iter_json_array(chunked(document), path='data.eggs')), EGGS)
+
+    def test_rejects_missing_path(self):
+        stream = iter_json_array(chunked({'data': {}}), path='data.eggs')
+        self.assertRaises(ValueError, list, stream)
+
+    def test_rejects_truncated_input(self):
+        stream = iter_json_array(chunked(EGGS)[:-3])
+        self.assertRaises(ValueError, list, stream)
+
+
+class DescribeStreamingCollection(TestCase):
+    def add_response(self, document, status=200):
+        responses.add(responses.GET, SERVER_EGG_COLLECTION_URL,
+                      body=json.dumps(document), status=status,
+                      content_type='application/json')
+
+    @responses.activate
+    def test_iteration_does_not_keep_elements(self):
+        self.add_response(EGGS)
+        collection = EggCollection()
+        self.assertEqual([egg.egg_id for egg in collection],
+                         [egg['egg_id'] for egg in EGGS])
+        self.assertEqual(collection._data, [])
+
+    @responses.activate
+    def test_first_reads_one_element(self):
+        self.add_response(EGGS)
+        self.assertEqual(EggCollection().first().egg_id, 'egg-0')
+
+    @responses.activate
+    def test_all_materializes_elements(self):
+        self.add_response(EGGS)
+        collection = EggCollection()
+        self.assertEqual(len(collection.all()), 20)
+        self.assertEqual(collection.count(), 20)
+
+    @responses.activate
+    def test_reads_enveloped_arrays(self):
+        self.add_response({'total': 20, 'data': {'eggs': EGGS}})
+        self.assertEqual(EnvelopedEggCollection().count(), 20)
+
+    @responses.activate
+    def test_raises_not_found(self):
+        self.add_response({}, status=404)
+        self.assertRaises(NotFound, list, EggCollection())
+
+    @responses.activate
+    def test_honors_deadlines(self):
+        self.add_response(EGGS)
+        with deadline(0.01):
+            time.sleep(0.02)
+            self.assertRaises(DeadlineExceeded, list, EggCollection())
+        self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_notifies_observers(self):
+        self.add_response(EGGS)
+        finished = []
+
+        class Recorder(Observer):
+            def request_finished(self, resource, url, status, size, seconds,
+                                 error=None):
+                finished.append((url, status))
+
+        observer = add_observer(Recorder())
+        self.addCleanup(remove_observer, observer)
+        self.assertEqual(len(list(EggCollection())), 20)
+        self.assertEqual(finished, [(SERVER_EGG_COLLECTION_URL, 200)])
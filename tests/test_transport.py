@@ -0,0 +1,195 @@
+from unittest import TestCase
+import gzip
+import json
+import time
+
+import requests
+import responses
+
+from apimodel import APICollection, APIModel, APIField, APICollectionField, \
+    HedgedTransport, Transport, deadline, get_default_transport, \
+    set_default_transport
+
+SERVER_EGG_URL = 'http://example.com/v1/eggs/{0}/'
+SERVER_EGG_COLLECTION_URL = 'http://example.com/v1/eggs/'
+
+
+class RecordingTransport(Transport):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return super().get(url, **kwargs)
+
+
+class Egg(APIModel):
+    transport = RecordingTransport()
+
+    fields = {
+        'egg_id': APIField(str),
+    }
+
+    finders = {
+        'egg_id': SERVER_EGG_URL,
+    }
+
+
+class Basket(APIModel):
+    fields = {
+        'eggs': APICollectionField(model=Egg, url=SERVER_EGG_COLLECTION_URL),
+    }
+
+
+class DescribeTransport(TestCase):
+    def test_reuses_one_session(self):
+        transport = Transport()
+        self.assertIs(transport.session, transport.session)
+
+    def test_applies_default_headers(self):
+        transport = Transport(headers={'X-Token': 'secret'})
+        self.assertEqual(transport.session.headers['X-Token'], 'secret')
+
+    def test_close_discards_session(self):
+        transport = Transport()
+        session = transport.session
+        transport.close()
+        self.assertIsNot(transport.session, session)
+
+    @responses.activate
+    def test_passes_timeout(self):
+        responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                      json={'egg_id': 'organic'})
+        transport = Transport(timeout=3)
+        response = transport.get(SERVER_EGG_URL.format('organic'))
+        self.assertEqual(response.json(), {'egg_id': 'organic'})
+        self.assertEqual(responses.calls[0].request.req_kwargs['timeout'], 3)
+
+
+class DescribeDefaultTransport(TestCase):
+    def setUp(self):
+        self.original = get_default_transport()
+
+    def tearDown(self):
+        set_default_transport(self.original)
+
+    def test_can_be_replaced(self):
+        transport = Transport()
+        set_default_transport(transport)
+        self.assertIs(get_default_transport(), transport)
+        self.assertIs(APIModel({}).get_transport(), transport)
+
+
+class DescribeModelTransport(TestCase):
+    def setUp(self):
+        Egg.transport.urls = []
+
+    @responses.activate
+    def test_model_uses_class_transport(self):
+        responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                      body=json.dumps({'egg_id': 'organic'}),
+                      content_type='application/json')
+        Egg(egg_id='organic')
+        self.assertEqual(Egg.transport.urls,
+                         [SERVER_EGG_URL.format('organic')])
+
+    @responses.activate
+    def test_collection_field_uses_model_transport(self):
+        responses.add(responses.GET, SERVER_EGG_COLLECTION_URL,
+                      body=json.dumps([{'egg_id': 'organic'}]),
+                      content_type='application/json')
+        basket = Basket({})
+        self.assertEqual(basket.eggs.count(), 1)
+        self.assertEqual(Egg.transport.urls, [SERVER_EGG_COLLECTION_URL])
+
+    def test_collection_prefers_own_transport(self):
+        transport = Transport()
+        collection = APICollection(model=Egg, data=[])
+        collection.transport = transport
+        self.assertIs(collection.get_transport(), transport)
+
+
+class DescribeCompression(TestCase):
+    def test_requests_compressed_responses(self):
+        transport = Transport()
+        self.assertEqual(transport.session.headers['Accept-Encoding'],
+                         'gzip, deflate')
+
+    def test_can_request_identity_encoding(self):
+        transport = Transport(compress=False)
+        self.assertEqual(transport.session.headers['Accept-Encoding'],
+                         'identity')
+
+    @responses.activate
+    def test_decodes_gzip_bodies(self):
+        body = gzip.compress(json.dumps({'egg_id': 'organic'}).encode())
+        responses.add(responses.GET, SERVER_EGG_URL.format('organic'),
+                      body=body, headers={'Content-Encoding': 'gzip'},
+                      content_type='application/json')
+        self.assertEqual(Egg(egg_id='organic').egg_id, 'organic')
+
+
+class DescribeHedgedTransport(TestCase):
+    def setUp(self):
+        self.transport = HedgedTransport(after=0.05, min_samples=3)
+        self.addCleanup(self.transport.close)
+        self.url = SERVER_EGG_URL.format('organic')
+        self.calls = 0
+
+    def slow_first_call(self, request):
+        self.calls += 1
+        if self.calls == 1:
+            time.sleep(0.5)
+        return 200, {}, json.dumps({'call': self.calls})
+
+    @responses.activate
+    def test_takes_first_response_of_hedged_request(self):
+        responses.add_callback(responses.GET, self.url,
+                               callback=self.slow_first_call)
+        start = time.monotonic()
+        response = self.transport.get(self.url)
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(response.json(), {'call': 2})
+        self.assertEqual((self.transport.hedged, self.transport.hedge_wins),
+                         (1, 1))
+
+    @responses.activate
+    def test_does_not_hedge_fast_requests(self):
+        responses.add(responses.GET, self.url, json={'egg_id': 'organic'})
+        self.transport.get(self.url)
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(self.transport.hedged, 0)
+
+    def test_uses_latency_percentile_once_sampled(self):
+        self.assertEqual(self.transport.hedge_delay(self.url), 0.05)
+        for seconds in (0.1, 0.2, 0.3):
+            self.transport._record(self.url, seconds)
+        self.assertEqual(self.transport.hedge_delay(self.url), 0.3)
+        self.transport.percentile = 50
+        self.assertEqual(self.transport.hedge_delay(self.url), 0.2)
+
+    def test_does_not_hedge_without_samples_or_delay(self):
+        self.assertIsNone(HedgedTransport().hedge_delay(self.url))
+
+    @responses.activate
+    def test_requests_see_the_callers_deadline(self):
+        responses.add(responses.GET, self.url, status=429,
+                      headers={'Retry-After': '1'})
+        start = time.monotonic()
+        with deadline(0.3):
+            response = self.transport.get(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertLess(time.monotonic() - start, 0.2)
+
+    @responses.activate
+    def test_waits_no_longer_than_the_deadline(self):
+        def slow(request):
+            time.sleep(0.5)
+            return 200, {}, '{}'
+
+        responses.add_callback(responses.GET, self.url, callback=slow)
+        start = time.monotonic()
+        with deadline(0.15):
+            self.assertRaises(requests.Timeout, self.transport.get, self.url)
+        self.assertLess(time.monotonic() - start, 0.4)